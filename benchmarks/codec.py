@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark the simple message codec against the generated flatbuffers classes
+"""
+
+import argparse
+from timeit import repeat
+
+import pyguppyclient.guppy_ipc.MessageData as MessageData
+import pyguppyclient.guppy_ipc.SimpleReplyData as SimpleReplyData
+from pyguppyclient.guppy_ipc.Content import Content
+from pyguppyclient.guppy_ipc.SimpleRequestType import SimpleRequestType
+from pyguppyclient.guppy_ipc.SimpleReplyType import SimpleReplyType
+
+from pyguppyclient.ipc import simple_request, simple_response
+from pyguppyclient.codec import encode_simple, decode_header, decode_simple
+
+
+def generated_response(buff):
+    """
+    The reply decoding of `simple_response` before the codec.
+    """
+    req = MessageData.MessageData.GetRootAsMessageData(buff, 0)
+    req.Version().MajorVersion()
+    if req.ContentType() == Content.SimpleReplyData:
+        cls = SimpleReplyData.SimpleReplyData()
+        cls.Init(req.Content().Bytes, req.Content().Pos)
+        return cls.Type(), cls.Data(), cls.Text()
+
+
+def codec_response(buff):
+    major, _, content_type, pos = decode_header(buff)
+    if content_type == Content.SimpleReplyData:
+        return decode_simple(buff, pos)
+
+
+def reply(reply_type, data=0):
+    """
+    A `SimpleReplyData` message built by reusing the request encoder.
+    """
+    buff = encode_simple(reply_type, 1, data=data)
+    req = MessageData.MessageData.GetRootAsMessageData(buff, 0)
+    # flip the content type in place, the two tables share the same layout
+    buff[req._tab.Offset(8) + req._tab.Pos] = Content.SimpleReplyData
+    return bytes(buff)
+
+
+def bench(name, stmt, number, runs):
+    best = min(repeat(stmt, number=number, repeat=runs)) / number
+    print("%-40s %10.2f us" % (name, best * 1e6))
+    return best
+
+
+def main(args):
+    client_id = 42
+    request = SimpleRequestType.GET_STATISTICS
+    buff = reply(SimpleReplyType.NONE_PENDING, data=client_id)
+
+    assert generated_response(buff) == codec_response(buff)
+    assert bytes(encode_simple(request, client_id)) == simple_request(request, client_id)
+
+    print("encode SimpleRequestData GET_STATISTICS")
+    before = bench("  flatbuffers Builder", lambda: encode_simple(request, client_id), args.number, args.repeat)
+    after = bench("  simple_request (cached)", lambda: simple_request(request, client_id), args.number, args.repeat)
+    print("  speedup %.1fx" % (before / after))
+
+    print("decode SimpleReplyData NONE_PENDING")
+    before = bench("  generated classes", lambda: generated_response(buff), args.number, args.repeat)
+    after = bench("  decode_header + decode_simple", lambda: codec_response(buff), args.number, args.repeat)
+    bench("  simple_response", lambda: simple_response(buff), args.number, args.repeat)
+    print("  speedup %.1fx" % (before / after))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--number", type=int, default=20000, help="calls per run")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="number of runs, the best is reported")
+    main(parser.parse_args())
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark encoding raw signal ReadBlockData messages
+"""
+
+import argparse
+from timeit import repeat
+
+import numpy as np
+from flatbuffers import Builder
+
+import pyguppyclient.guppy_ipc.ReadBlockData as ReadBlockData
+from pyguppyclient.codec import ReadBlockEncoder, _END_VECTOR_COUNT
+
+
+def generated(signal):
+    """
+    The raw data vector prepended element by element with the generated helpers.
+    """
+    builder = Builder(1024)
+    ReadBlockData.ReadBlockDataStartRawDataVector(builder, len(signal))
+    for sample in reversed(signal.tolist()):
+        builder.PrependInt16(sample)
+    raw = builder.EndVector(len(signal)) if _END_VECTOR_COUNT else builder.EndVector()
+    ReadBlockData.ReadBlockDataStart(builder)
+    ReadBlockData.ReadBlockDataAddRawData(builder, raw)
+    builder.Finish(ReadBlockData.ReadBlockDataEnd(builder))
+    return builder.Output()
+
+
+def numpy_vector(signal):
+    """
+    A new builder for every message with `CreateNumpyVector`.
+    """
+    builder = Builder(1024)
+    raw = builder.CreateNumpyVector(signal)
+    ReadBlockData.ReadBlockDataStart(builder)
+    ReadBlockData.ReadBlockDataAddRawData(builder, raw)
+    builder.Finish(ReadBlockData.ReadBlockDataEnd(builder))
+    return builder.Output()
+
+
+def bench(name, stmt, number, runs, samples):
+    best = min(repeat(stmt, number=number, repeat=runs)) / number
+    print("%-28s %10.3f ms %10.1f Msamples/s" % (name, best * 1e3, samples / best / 1e6))
+    return best
+
+
+def main(args):
+    signal = np.random.randint(-2**15, 2**15, args.samples).astype(np.int16)
+    encoder = ReadBlockEncoder()
+
+    print("encode %s samples" % args.samples)
+    if not args.skip_generated:
+        bench("generated helpers", lambda: generated(signal), 1, 1, args.samples)
+    bench("CreateNumpyVector", lambda: numpy_vector(signal), args.number, args.repeat, args.samples)
+    bench("ReadBlockEncoder", lambda: encoder.encode(1, 1, "read", signal), args.number, args.repeat, args.samples)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-s", "--samples", type=int, default=1000000, help="samples in the read")
+    parser.add_argument("-n", "--number", type=int, default=20, help="calls per run")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="number of runs, the best is reported")
+    parser.add_argument("--skip-generated", action="store_true", default=False,
+                        help="skip the element by element encoder")
+    main(parser.parse_args())
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark the cold start import time of pyguppyclient entry points
+
+Each statement is run in a fresh interpreter and the time over an empty
+interpreter start is reported, with the heaviest modules it imported from
+`python -X importtime`.
+"""
+
+import sys
+import argparse
+import subprocess
+from time import perf_counter
+
+
+STATEMENTS = (
+    "import pyguppyclient",
+    "import pyguppyclient.utils",
+    "import pyguppyclient.stats",
+    "from pyguppyclient import GuppyClientBase",
+    "from pyguppyclient import yield_reads",
+    "from pyguppyclient import Caller",
+)
+
+
+def run(statement, importtime=False):
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", statement]
+    start = perf_counter()
+    result = subprocess.run(command, stderr=subprocess.PIPE, check=True, universal_newlines=True)
+    return perf_counter() - start, result.stderr
+
+
+def heaviest(stderr, count):
+    """
+    The top level modules with the largest cumulative import time in microseconds.
+    """
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name.startswith("  "):
+            modules.append((int(cumulative), name.strip()))
+    return sorted(modules, reverse=True)[:count]
+
+
+def main(args):
+    baseline = min(run("pass")[0] for _ in range(args.repeat))
+    print("%-44s %10s" % ("statement", "ms"))
+    for statement in STATEMENTS:
+        best = min(run(statement)[0] for _ in range(args.repeat))
+        print("%-44s %10.1f" % (statement, (best - baseline) * 1e3))
+        if args.top:
+            for cumulative, name in heaviest(run(statement, importtime=True)[1], args.top):
+                print("    %-40s %10.1f" % (name, cumulative / 1e3))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="number of runs, the best is reported")
+    parser.add_argument("-t", "--top", type=int, default=0, help="show the heaviest top level imports")
+    main(parser.parse_args())
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark mapping basecalled bases back to the signal with the move table
+"""
+
+import argparse
+from timeit import repeat
+
+import numpy as np
+
+from pyguppyclient.decode import ReadData, CalledReadData
+from pyguppyclient.moves import map_read
+
+
+def naive(read, called):
+    """
+    The per base loop over the move table.
+    """
+    start = read.total_samples - called.trimmed_samples
+    starts = []
+    for i, moved in enumerate(called.move):
+        if moved:
+            starts.append(start + i * called.model_stride)
+    ends = starts[1:] + [read.total_samples]
+    means = []
+    for begin, end in zip(starts, ends):
+        values = [(sample + read.daq_offset) * read.daq_scaling for sample in read.signal[begin:end]]
+        means.append(sum(values) / len(values))
+    return {'start': starts, 'end': ends, 'dwell': [e - s for s, e in zip(starts, ends)], 'mean': means}
+
+
+def simulate(samples, stride=5, trimmed=400, seed=0):
+    state = np.random.RandomState(seed)
+    read = ReadData(state.randint(200, 800, samples).astype(np.int16), "read", offset=4.0, scaling=0.15)
+    move = (state.rand((samples - trimmed) // stride) < 0.45).astype(np.uint8)
+    move[0] = 1
+    called = CalledReadData(
+        '', '', len(move), int(move.sum()), 40, 'crf', samples - trimmed, stride, 10.0, move=move
+    )
+    return read, called
+
+
+def bench(name, stmt, number, runs, bases):
+    best = min(repeat(stmt, number=number, repeat=runs)) / number
+    print("%-28s %10.3f ms %10.2f Mbases/s" % (name, best * 1e3, bases / best / 1e6))
+    return best
+
+
+def main(args):
+    pairs = [simulate(args.samples, seed=i) for i in range(args.reads)]
+    bases = sum(int(called.move.sum()) for _, called in pairs)
+
+    for read, call in pairs[:3]:
+        expected = naive(read, call)
+        mapped = map_read(read, call)
+        assert np.array_equal(mapped['start'], expected['start'])
+        assert np.allclose(mapped['mean'], expected['mean'])
+
+    print("map %s reads of %s samples, %s bases" % (args.reads, args.samples, bases))
+    if not args.skip_naive:
+        before = bench("naive loop", lambda: [naive(*pair) for pair in pairs], 1, 1, bases)
+    after = bench("map_read", lambda: [map_read(*pair) for pair in pairs], args.number, args.repeat, bases)
+    if not args.skip_naive:
+        print("speedup %.0fx" % (before / after))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-s", "--samples", type=int, default=40000, help="samples per read")
+    parser.add_argument("-R", "--reads", type=int, default=100, help="number of reads")
+    parser.add_argument("-n", "--number", type=int, default=5, help="calls per run")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="number of runs, the best is reported")
+    parser.add_argument("--skip-naive", action="store_true", default=False, help="skip the python loop")
+    main(parser.parse_args())
@@ -1,9 +1,44 @@
 __version__ = '0.1.0'
 
-from pyguppyclient.io import *
-from pyguppyclient.caller import Caller
-from pyguppyclient.client import GuppyBasecallerClient
-from pyguppyclient.decode import ReadData, CalledReadData
-from pyguppyclient.client import GuppyClientBase, GuppyAsyncClientBase
+from importlib import import_module
 
-from ont_fast5_api.conversion_tools.conversion_utils import get_fast5_file_list as get_fast5_files
+# public names and the modules providing them, imported on first access so
+# `import pyguppyclient` doesn't pull in h5py, zmq and pyguppy_client_lib, the
+# helper modules (alignment, moves, rle, modbase, scaling) are imported directly
+_exports = {
+    'yield_reads': ('pyguppyclient.io', 'yield_reads'),
+    'load_reads': ('pyguppyclient.io', 'load_reads'),
+    'write_fasta': ('pyguppyclient.io', 'write_fasta'),
+    'write_fastq': ('pyguppyclient.io', 'write_fastq'),
+    'setup_logger': ('pyguppyclient.io', 'setup_logger'),
+    'get_fast5_file': ('pyguppyclient.io', 'get_fast5_file'),
+    'ReadFilter': ('pyguppyclient.io', 'ReadFilter'),
+    'ReadMetadata': ('pyguppyclient.io', 'ReadMetadata'),
+    'DemuxWriter': ('pyguppyclient.io', 'DemuxWriter'),
+    'SummaryWriter': ('pyguppyclient.io', 'SummaryWriter'),
+    'StateStore': ('pyguppyclient.io', 'StateStore'),
+    'open_states': ('pyguppyclient.io', 'open_states'),
+    'Caller': ('pyguppyclient.caller', 'Caller'),
+    'GuppyBasecallerClient': ('pyguppyclient.client', 'GuppyBasecallerClient'),
+    'GuppyClientBase': ('pyguppyclient.client', 'GuppyClientBase'),
+    'GuppyAsyncClientBase': ('pyguppyclient.client', 'GuppyAsyncClientBase'),
+    'ReadData': ('pyguppyclient.decode', 'ReadData'),
+    'CalledReadData': ('pyguppyclient.decode', 'CalledReadData'),
+    'get_fast5_files': ('ont_fast5_api.conversion_tools.conversion_utils', 'get_fast5_file_list'),
+}
+
+__all__ = sorted(_exports)
+
+
+def __getattr__(name):
+    try:
+        module, attribute = _exports[name]
+    except KeyError:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name)) from None
+    value = getattr(import_module(module), attribute)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_exports))
@@ -0,0 +1,223 @@
+"""
+pyguppyclient alignment result summaries
+"""
+
+import numpy as np
+
+
+class GenomeSummary:
+    """
+    The binned coverage and identity and accuracy distributions of the
+    alignments to one genome.
+
+    :param bin_size: the genome bases per coverage bin.
+    :param bins: the number of identity and accuracy histogram bins over [0, 1].
+    """
+    def __init__(self, bin_size=10000, bins=100):
+        self.bin_size = bin_size
+        self.reads = 0
+        self.bases = 0
+        self.coverage = np.zeros(0, dtype=np.int64)
+        self.identity = np.zeros(bins, dtype=np.int64)
+        self.accuracy = np.zeros(bins, dtype=np.int64)
+
+    def __repr__(self):
+        return "%s(%s reads)" % (self.__class__.__name__, self.reads)
+
+    def _grow(self, size):
+        if size > len(self.coverage):
+            coverage = np.zeros(max(size, 2 * len(self.coverage)), dtype=np.int64)
+            coverage[:len(self.coverage)] = self.coverage
+            self.coverage = coverage
+
+    def _histogram(self, values):
+        bins = len(self.identity)
+        index = np.clip((np.asarray(values) * bins).astype(np.int64), 0, bins - 1)
+        return np.bincount(index, minlength=bins)
+
+    def add(self, start, end, identity, accuracy):
+        """
+        Accumulate a batch of alignments given as arrays of their genome
+        `start` and exclusive `end` and their `identity` and `accuracy`.
+        """
+        start = np.asarray(start, dtype=np.int64)
+        end = np.asarray(end, dtype=np.int64)
+        keep = end > start
+        start, end = start[keep], end[keep]
+        self.reads += len(keep)
+        self.identity += self._histogram(identity)
+        self.accuracy += self._histogram(accuracy)
+        if not len(start):
+            return
+
+        size = self.bin_size
+        first = start // size
+        last = (end - 1) // size
+        self.bases += int((end - start).sum())
+        self._grow(int(last.max()) + 2)
+        length = len(self.coverage)
+
+        # the bases in the first and last bins an alignment touches
+        single = first == last
+        head = np.where(single, end, (first + 1) * size) - start
+        tail = np.where(single, 0, end - last * size)
+        covered = np.bincount(first, weights=head, minlength=length)
+        covered += np.bincount(last, weights=tail, minlength=length)
+
+        # every bin strictly between them is fully covered, as a difference array
+        inner = last > first + 1
+        steps = np.bincount(first[inner] + 1, minlength=length) - np.bincount(last[inner], minlength=length)
+        self.coverage += covered.astype(np.int64) + size * np.cumsum(steps)
+
+    def merge(self, other):
+        self.reads += other.reads
+        self.bases += other.bases
+        self._grow(len(other.coverage))
+        self.coverage[:len(other.coverage)] += other.coverage
+        self.identity += other.identity
+        self.accuracy += other.accuracy
+
+    def depth(self):
+        """
+        The mean depth of each coverage bin.
+        """
+        return self.coverage / self.bin_size
+
+    def percentile(self, histogram, q):
+        """
+        The `q` percentile of the `identity` or `accuracy` histogram, to the bin midpoint.
+        """
+        total = histogram.sum()
+        if not total:
+            return 0.0
+        index = np.searchsorted(np.cumsum(histogram), q / 100 * total)
+        return float((min(index, len(histogram) - 1) + 0.5) / len(histogram))
+
+
+class AlignmentSummary:
+    """
+    Per genome coverage, identity and accuracy of streamed alignment results.
+
+    The `alignment` dicts of called reads are queued and accumulated in
+    batches of `batch` alignments with numpy, so a run is summarised
+    without writing or parsing SAM. Coverage is kept as the bases aligned
+    to each `bin_size` window of a genome.
+
+    :param bin_size: the genome bases per coverage bin.
+    :param bins: the number of identity and accuracy histogram bins over [0, 1].
+    :param batch: the alignments to queue before accumulating them.
+
+    >>> summary = AlignmentSummary(bin_size=10, bins=10)
+    >>> summary.add({'genome': ['chr1', 'chr1'], 'genome_start': [5, 12], 'genome_end': [35, 18],
+    ...              'identity': [0.91, 0.97], 'accuracy': [0.85, 0.95]})
+    >>> summary.add(None)
+    >>> chr1 = summary['chr1']
+    >>> chr1.coverage.tolist()[:4], chr1.reads, chr1.bases
+    ([5, 16, 10, 5], 2, 36)
+    >>> summary.report()['chr1']['median_identity'], summary.unaligned
+    (0.95, 1)
+    """
+    def __init__(self, bin_size=10000, bins=100, batch=4096):
+        self.bin_size = bin_size
+        self.bins = bins
+        self.batch = batch
+        self.unaligned = 0
+        self.genomes = dict()
+        self.pending = []
+        self.queued = 0
+
+    def __repr__(self):
+        return "%s(%s genomes)" % (self.__class__.__name__, len(self.genomes))
+
+    def __getitem__(self, genome):
+        self.flush()
+        return self.genomes[genome]
+
+    def __iadd__(self, other):
+        return self.merge(other)
+
+    def __getstate__(self):
+        self.flush()
+        return self.__dict__.copy()
+
+    def add(self, alignment):
+        """
+        Queue the `alignment` dict of a `CalledReadData`, `None` counts as unaligned.
+        """
+        if alignment is None or not len(alignment['genome']):
+            self.unaligned += 1
+            return
+        self.pending.append(alignment)
+        self.queued += len(alignment['genome'])
+        if self.queued >= self.batch:
+            self.flush()
+
+    def flush(self):
+        """
+        Accumulate the queued alignments.
+        """
+        if not self.pending:
+            return
+        pending, self.pending, self.queued = self.pending, [], 0
+        genome = np.concatenate([np.asarray(a['genome'], dtype=object) for a in pending])
+        columns = {
+            name: np.concatenate([np.asarray(a[name]) for a in pending])
+            for name in ('genome_start', 'genome_end', 'identity', 'accuracy')
+        }
+        names, index = np.unique(genome, return_inverse=True)
+        order = np.argsort(index, kind='stable')
+        bounds = np.searchsorted(index[order], np.arange(len(names) + 1))
+        for i, name in enumerate(names):
+            rows = order[bounds[i]:bounds[i + 1]]
+            if name not in self.genomes:
+                self.genomes[name] = GenomeSummary(self.bin_size, self.bins)
+            self.genomes[name].add(
+                columns['genome_start'][rows], columns['genome_end'][rows],
+                columns['identity'][rows], columns['accuracy'][rows],
+            )
+
+    def merge(self, other):
+        """
+        Merge the alignments of another summary, e.g. from a worker process.
+        """
+        self.flush()
+        other.flush()
+        self.unaligned += other.unaligned
+        for name, genome in other.genomes.items():
+            if name not in self.genomes:
+                self.genomes[name] = GenomeSummary(self.bin_size, self.bins)
+            self.genomes[name].merge(genome)
+        return self
+
+    def report(self):
+        """
+        The reads, aligned bases, mean depth, breadth and median identity and
+        accuracy of each genome, breadth is the fraction of bins with any coverage.
+        """
+        self.flush()
+        results = dict()
+        for name, genome in sorted(self.genomes.items()):
+            # the coverage array is grown in doubling steps past the last covered bin
+            covered = np.nonzero(genome.coverage)[0]
+            length = covered[-1] + 1 if len(covered) else 0
+            results[name] = {
+                'reads': genome.reads,
+                'bases': genome.bases,
+                'mean_depth': genome.bases / (length * self.bin_size) if length else 0.0,
+                'breadth': len(covered) / length if length else 0.0,
+                'median_identity': genome.percentile(genome.identity, 50),
+                'median_accuracy': genome.percentile(genome.accuracy, 50),
+            }
+        return results
+
+    def format(self):
+        lines = ["%-24s %10s %14s %10s %8s %10s %10s" % (
+            "genome", "reads", "bases", "depth", "breadth", "identity", "accuracy"
+        )]
+        for name, row in self.report().items():
+            lines.append("%-24s %10s %14s %10.2f %8.3f %10.3f %10.3f" % (
+                name, row['reads'], row['bases'], row['mean_depth'], row['breadth'],
+                row['median_identity'], row['median_accuracy'],
+            ))
+        lines.append("unaligned %s" % self.unaligned)
+        return "\n".join(lines)
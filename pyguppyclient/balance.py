@@ -0,0 +1,164 @@
+"""
+pyguppyclient server load balancing
+"""
+
+import logging
+from time import perf_counter
+
+from pyguppyclient.stats import StatsCollector
+
+
+logger = logging.getLogger("pyguppyclient")
+
+
+class Endpoint:
+    """
+    The observed performance of a single guppy_basecall_server.
+
+    :param host: the host address of the guppy_basecall_server.
+    :param port: the port of the guppy_basecall_server.
+    :param alpha: the smoothing factor for the throughput moving average.
+    """
+    def __init__(self, host, port, alpha=0.3):
+        self.host = host
+        self.port = port
+        self.alpha = alpha
+        self.rate = None
+        self.drain = 0.0
+        self.backlog = 0
+        self.pending = 0
+        self.batches = 0
+        self.samples = 0
+        self.healthy = True
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, self.address)
+
+    @property
+    def address(self):
+        return "%s:%s" % (self.host, self.port)
+
+    def update(self, samples, duration):
+        """
+        Fold the samples/s of a completed batch into the moving average.
+        """
+        rate = samples / max(duration, 1e-6)
+        if self.rate is None:
+            self.rate = rate
+        else:
+            self.rate = self.alpha * rate + (1 - self.alpha) * self.rate
+        self.batches += 1
+        self.samples += samples
+
+    def update_stats(self, stats, period=5.0):
+        """
+        Update the server queue depth from a `StatsCollector.poll` result.
+        """
+        self.backlog = stats['backlog']
+        self.drain = self.backlog / max(stats['period_reads_out'] / period, 1.0)
+
+
+class Balancer:
+    """
+    Weights work across several guppy_basecall_servers.
+
+    Each batch is assigned to the server expected to finish it first,
+    estimated from the observed samples/s of the batches it has already
+    completed, the batches currently assigned to it and the time needed
+    to drain the queue reported by `GET_STATISTICS`.
+
+    :param servers: a list of `(host, port)` tuples.
+    :param interval: the minimum time in seconds between statistics polls.
+    :param timeout: the time in seconds to wait for the statistics replies.
+
+    >>> balancer = Balancer([('localhost', 5555), ('localhost', 5556)])
+    >>> first, second = balancer.acquire(), balancer.acquire()
+    >>> first.port, second.port
+    (5555, 5556)
+    >>> balancer.release(first, 4000, 1.0)
+    >>> balancer.release(second, 4000, 4.0)
+    >>> [balancer.acquire().port for _ in range(3)]
+    [5555, 5555, 5555]
+    """
+    def __init__(self, servers, interval=5.0, timeout=1.0):
+        self.interval = interval
+        self.timeout = timeout
+        self.endpoints = [Endpoint(host, port) for host, port in servers]
+        self.batch_samples = None
+        self.last_refresh = None
+        self.collector = None
+
+    def __len__(self):
+        return len(self.endpoints)
+
+    def cost(self, endpoint):
+        """
+        The expected time in seconds until a new batch on `endpoint` completes.
+        """
+        rates = [e.rate for e in self.endpoints if e.rate]
+        rate = endpoint.rate or max(rates, default=1.0)
+        batch_samples = self.batch_samples or 1.0
+        return (endpoint.pending + 1) * batch_samples / rate + endpoint.drain
+
+    def acquire(self):
+        """
+        Select the endpoint for the next batch.
+        """
+        candidates = [e for e in self.endpoints if e.healthy] or self.endpoints
+        endpoint = min(candidates, key=lambda e: (self.cost(e), e.batches))
+        endpoint.pending += 1
+        return endpoint
+
+    def release(self, endpoint, samples, duration):
+        """
+        Record the completion of a batch of `samples` on `endpoint`.
+        """
+        endpoint.pending -= 1
+        endpoint.update(samples, duration)
+        if self.batch_samples is None:
+            self.batch_samples = samples
+        else:
+            self.batch_samples = 0.3 * samples + 0.7 * self.batch_samples
+
+    def refresh(self, force=False):
+        """
+        Poll the queue depth of every server, at most once per `interval`.
+
+        The servers are polled concurrently so a round waits at most
+        `timeout` however many servers are unreachable.
+        """
+        now = perf_counter()
+        if not force and self.last_refresh is not None and now - self.last_refresh < self.interval:
+            return
+        self.last_refresh = now
+
+        if self.collector is None:
+            self.collector = StatsCollector([e.address for e in self.endpoints], timeout=self.timeout, history=1)
+
+        results = self.collector.poll()
+
+        for endpoint in self.endpoints:
+            stats = results[endpoint.address]
+            endpoint.healthy = stats is not None
+            if stats is None:
+                logger.debug("statistics request to %s timed out", endpoint.address)
+                continue
+            endpoint.update_stats(stats)
+
+    def close(self):
+        """
+        Close the statistics sockets.
+        """
+        if self.collector is not None:
+            self.collector.close()
+            self.collector = None
+
+    def summary(self):
+        """
+        A per server summary of the work completed.
+        """
+        return {
+            e.address: {'batches': e.batches, 'samples': e.samples, 'rate': e.rate}
+            for e in self.endpoints
+        }
+
@@ -4,18 +4,87 @@ pyguppyclient callers objects
 
 import math
 import logging
+
+import numpy as np
+from copy import copy
 from itertools import chain
-from time import sleep
+from operator import attrgetter
+from collections import defaultdict
+from time import sleep, perf_counter, perf_counter_ns
 from multiprocessing import Manager
-from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.util import Finalize
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 
 from pyguppyclient.io import yield_reads
-from pyguppyclient.utils import distribute, batches, parse_config
+from pyguppyclient.balance import Balancer
+from pyguppyclient.alignment import AlignmentSummary
+from pyguppyclient.moves import signal_start
+from pyguppyclient.scaling import scale_reads, read_scaling, check_scaling
+from pyguppyclient.flow import AdaptiveWindow, SubmissionQueue, MemoryBudget
+from pyguppyclient.prometheus import MetricsServer
+from pyguppyclient.metrics import LatencyRecorder, SharedMetrics
 from pyguppyclient.client import GuppyBasecallerClient
+from pyguppyclient.utils import distribute, batches, parse_config, parse_server, schedule, POLICIES
 
 logger = logging.getLogger("pyguppyclient")
 logger.setLevel(logging.DEBUG)
 
+# per process in-flight windows keyed by server so they persist across batches
+_windows = dict()
+
+# per process slot of the shared memory metrics
+_metrics = None
+
+# the memory budget shared by the workers of a pool
+_budget = None
+
+# per process connected clients keyed by config, transport and server, reused across batches
+_clients = dict()
+
+# per process copies of the output sinks keyed by their output, closed when the process exits
+_writers = dict()
+
+
+def _init_worker(metrics, caller=None, budget=None):
+    global _metrics, _budget
+    if metrics is not None:
+        _metrics = metrics.attach()
+    _budget = budget
+    if caller is not None:
+        for host, port in caller.servers:
+            try:
+                caller.client(host, port)
+            except Exception as e:
+                # the first batch sent to this server will raise it
+                logger.warning("connecting to %s:%s failed: %s", host, port, e)
+
+
+def _disconnect(client):
+    try:
+        client.disconnect()
+    except Exception as e:
+        logger.warning("disconnecting from %s failed: %s", client.address, e)
+
+
+def _disconnect_clients():
+    while _clients:
+        _disconnect(_clients.popitem()[1])
+
+
+def _close_writers():
+    while _writers:
+        _writers.popitem()[1].close()
+
+
+def _called_nbytes(called):
+    """
+    The bytes held by the sequence, quality and arrays of a `CalledReadData`.
+    """
+    nbytes = len(called.seq) + len(called.qual)
+    arrays = [called.state, called.move, called.weight, called.base_mod_probs]
+    arrays.extend(called.trace.values() if isinstance(called.trace, dict) else [called.trace])
+    return nbytes + sum(array.nbytes for array in arrays if isinstance(array, np.ndarray))
+
 
 class Caller:
     """
@@ -31,16 +100,117 @@ class Caller:
     :param port: the port of the guppy_basecall_server.
     :param procs: the number of processes to use.
     :param inflight: number of inflight reads to limit each process to.
+    :param servers: an optional list of guppy_basecall_server endpoints, either ports,
+                    `host:port` strings or `(host, port)` tuples, to share the work
+                    across. Batches are weighted toward the servers with the highest
+                    observed throughput and shortest queues. Overrides `host` and `port`,
+                    `procs` should be at least the number of servers.
+    :param adaptive: adapt the number of reads each process keeps in flight, starting
+                     from `inflight`, with an AIMD controller driven by the measured
+                     completion latency and samples/s.
+    :param max_inflight: the largest in-flight window for the adaptive controller.
+    :param metrics_port: serve Prometheus metrics of the run from the parent process on
+                         `http://127.0.0.1:<metrics_port>/metrics`, the workers publish
+                         through shared memory counters.
+    :param transport: the client transport, `pcl` for `pyguppy_client_lib` or `zmq` for
+                      the native zero-copy transport.
+    :param policy: the order each batch's reads are submitted in by signal length, `fifo`,
+                   `longest` first or length `binned` interleaving, see `utils.schedule`.
+                   The end of run idle time is kept in `idle` to compare them.
+    :param priority: an optional function of a `ReadData` returning its `(priority, deadline)`,
+                     reads with a higher priority are submitted first and the deadline, in
+                     seconds or `None`, is checked on completion. Met and missed deadlines
+                     are counted per priority in `deadlines`.
+    :param reserve: the in-flight window slots held back for reads with a priority above zero,
+                    needs `adaptive`.
+    :param read_filter: an optional predicate of a `ReadMetadata` selecting the reads to basecall
+                        before their signal is loaded, e.g. an `io.ReadFilter`.
+    :param client_scaling: compute the median/MAD scaling of the reads in the workers and
+                           send it as a `ScalingOverride` so the server skips it. Needs
+                           `transport="zmq"`.
+    :param scaling_trim: the samples at the start of each read left out of the client scaling,
+                         as the server leaves out the samples it trims.
+    :param scaling_check: with `client_scaling`, every `scaling_check`th read of a batch is
+                          sent without an override and the client scaling of its signal after
+                          the server's own trim is checked against the scaling the server reports.
+    :param demux: an optional `io.DemuxWriter` the called reads are written to by barcode,
+                  each process buffers its own reads and they share the caller's lock to
+                  write them out.
+    :param summary: an optional `io.SummaryWriter` the sequencing summary of the called
+                    reads is written to, each process buffers its own rows.
+    :param states: an optional `io.StateStore` the state posteriors of the called reads are
+                   written to, the state data is requested from the server and each
+                   `CalledReadData.state` passed on holds a `StateHandle` in its place.
+                   Needs `transport="pcl"`.
+    :param memory_budget: an optional limit in bytes on the signal and results held by all
+                          the workers together, the loaded reads waiting to be submitted,
+                          the in-flight reads and the called reads not yet through the
+                          sinks and callback. A worker stops loading reads once the budget
+                          is spent, holding at most one read over it, and blocks when it has
+                          nothing else to do. Called reads are always admitted, they count
+                          against the budget to hold back loading. The usage per stage is
+                          kept in `memory`, a `flow.MemoryBudget`.
+    :param alignments: summarise the alignment results of the called reads, the
+                       per genome coverage, identity and accuracy are merged from
+                       every batch into `alignments`, an `alignment.AlignmentSummary`.
     """
 
-    def __init__(self, config, callback=None, host='127.0.0.1', port=5555, inflight=50, procs=4):
+    def __init__(self, config, callback=None, host='127.0.0.1', port=5555, inflight=50, procs=4, servers=None,
+                 adaptive=False, max_inflight=2000, metrics_port=None, transport="pcl",
+                 policy='fifo', priority=None, reserve=0, read_filter=None, client_scaling=False,
+                 scaling_trim=0, scaling_check=100, demux=None, summary=None, states=None,
+                 memory_budget=None, alignments=False):
+        if policy not in POLICIES:
+            raise ValueError("Unknown policy '{}', expected one of {}".format(policy, POLICIES))
+        if client_scaling and transport != "zmq":
+            raise ValueError("client_scaling needs the zmq transport to send the scaling override")
+        if reserve and not adaptive:
+            raise ValueError("reserve needs the adaptive in-flight window to hold slots back from")
+        if states is not None and transport != "pcl":
+            raise ValueError("states needs the pcl transport to request the state data")
         self.host = host
         self.port = port
         self.procs = procs
+        self.servers = [parse_server(s, host=host) for s in servers or [(host, port)]]
         self.snooze = 1e-2
         self.callback = callback
         self.inflight = inflight
+        self.adaptive = adaptive
+        self.max_inflight = max_inflight
+        self.metrics_port = metrics_port
+        self.transport = transport
+        self.policy = policy
+        self.priority = priority
+        self.reserve = reserve
+        self.read_filter = read_filter
+        self.client_scaling = client_scaling
+        self.scaling_trim = scaling_trim
+        self.scaling_check = scaling_check
+        self.demux = demux
+        self.summary = summary
+        self.states = states
+        self.memory_budget = memory_budget
+        self.memory = None
+        self.summarise_alignments = alignments
         self.config = parse_config(config)
+        self.balancer = None
+        self.metrics = None
+        self.latency = LatencyRecorder()
+        self.idle = 0.0
+        self.drain = 0.0
+        self.deadlines = {'met': defaultdict(int), 'missed': defaultdict(int)}
+        self.alignments = AlignmentSummary() if alignments else None
+
+    def __getstate__(self):
+        # the caller is pickled for every batch, leave the parent only state behind
+        state = self.__dict__.copy()
+        state['balancer'] = None
+        state['metrics'] = None
+        state['latency'] = None
+        state['deadlines'] = None
+        state['alignments'] = None
+        state['memory'] = None
+        return state
 
     def basecall(self, files):
         """
@@ -56,28 +226,180 @@ class Caller:
         files = distribute(files, self.procs)
         work = batches(files, n=min(batch_size, self.inflight))
         self.lock = manager.Lock()
+        self.latency.reset()
+        self.balancer = balancer = Balancer(self.servers)
+
+        samples = 0
+        running = dict()
+        finished = []
+        exporter = None
+        self.drain = 0.0
+        self.deadlines = {'met': defaultdict(int), 'missed': defaultdict(int)}
+        self.alignments = AlignmentSummary() if self.summarise_alignments else None
+        self.memory = MemoryBudget(self.memory_budget) if self.memory_budget is not None else None
+
+        if self.metrics_port is not None:
+            self.metrics = SharedMetrics(self.procs)
+            exporter = MetricsServer(self.metrics, self.servers, port=self.metrics_port)
+            exporter.start()
+
+        try:
+            with ProcessPoolExecutor(max_workers=self.procs, initializer=_init_worker,
+                                     initargs=(self.metrics, self, self.memory)) as pool:
 
-        with ProcessPoolExecutor(max_workers=self.procs) as pool:
-            return sum(pool.map(self.basecall_batch, work))
+                def submit():
+                    for batch in work:
+                        endpoint = balancer.acquire()
+                        future = pool.submit(self.basecall_batch, batch, endpoint.host, endpoint.port)
+                        running[future] = endpoint, perf_counter()
+                        return
+                    # out of work, this worker sits idle until the run ends
+                    finished.append(perf_counter())
 
-    def basecall_batch(self, files):
+                for _ in range(self.procs):
+                    submit()
+
+                while running:
+                    done, _ = wait(running, timeout=balancer.interval, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        endpoint, start = running.pop(future)
+                        batch_samples, latency, drain, deadlines, alignments = future.result()
+                        if alignments is not None:
+                            self.alignments.merge(alignments)
+                        self.latency.merge(latency)
+                        self.drain += drain
+                        for outcome, counts in deadlines.items():
+                            for level, count in counts.items():
+                                self.deadlines[outcome][level] += count
+                        balancer.release(endpoint, batch_samples, perf_counter() - start)
+                        samples += batch_samples
+                        submit()
+                    if len(balancer) > 1:
+                        balancer.refresh()
+        finally:
+            if exporter is not None:
+                exporter.stop()
+            balancer.close()
+
+        end = perf_counter()
+        self.idle = sum(end - t for t in finished)
+
+        for address, summary in balancer.summary().items():
+            logger.debug("%s: %s batches, %s samples", address, summary['batches'], summary['samples'])
+        logger.debug("read lifecycle latency\n%s", self.latency.format())
+        logger.debug("%s policy: %.3fs end of run idle, %.3fs batch drain", self.policy, self.idle, self.drain)
+        if self.memory is not None:
+            logger.debug("%s", self.memory.format())
+
+        return samples
+
+    def basecall_batch(self, files, host=None, port=None):
         """
         Basecall a list `files`.
 
         :param files: a list of filenames to basecall.
-        :returns: the total number of raw samples processed.
+        :param host: the host address of the server to use, defaults to `self.host`.
+        :param port: the port of the server to use, defaults to `self.port`.
+        :returns: a tuple of the total number of raw samples processed, the
+                  `LatencyRecorder` of the read lifecycle, the seconds spent
+                  draining the last reads once all were submitted, the met
+                  and missed deadlines per priority and the `AlignmentSummary`
+                  of the batch when summarising alignments.
         """
         done = 0
         samples = 0
-        reads = [read for fn in files for read in yield_reads(fn)]
+        loaded = 0
+        inflight = dict()
+        latency = LatencyRecorder()
+        host = host or self.host
+        port = port or self.port
+        budget = _budget
+        source = (read for fn in files for read in yield_reads(fn, self.read_filter))
+        # a read loaded but not yet admitted by the memory budget
+        held = []
+        exhausted = False
+        pending = SubmissionQueue(reserve=self.reserve)
+
+        def queue(reads):
+            nonlocal loaded
+            if self.client_scaling:
+                # the reads left to the server's scaling to check the client's against
+                scale_reads(
+                    [read for i, read in enumerate(reads) if not self.scaling_check or i % self.scaling_check],
+                    self.scaling_trim,
+                )
+            for read in schedule(reads, self.policy, key=attrgetter('total_samples')):
+                if self.priority is None:
+                    pending.put(read)
+                else:
+                    pending.put(read, *self.priority(read))
+            loaded += len(reads)
 
-        with GuppyBasecallerClient(config_name=self.config, host=self.host, port=self.port) as client:
-            # submit reads
-            for read in reads:
-                client.pass_read(read)
+        def load():
+            """
+            Queue the next reads, every read without a memory budget or
+            else as many as the budget admits.
+            """
+            nonlocal exhausted
+            reads = []
+            while not exhausted:
+                read = held.pop() if held else next(source, None)
+                if read is None:
+                    exhausted = True
+                elif budget is None or budget.try_acquire('loaded', read.signal.nbytes):
+                    reads.append(read)
+                else:
+                    held.append(read)
+                    break
+            queue(reads)
 
-            # poll to collect called reads
-            while done < len(reads):
+        load()
+        drained = None
+        window = self.window(host, port)
+        metrics = _metrics
+        writer = self.sink(self.demux)
+        summary = self.sink(self.summary)
+        states = self.sink(self.states)
+        alignments = AlignmentSummary() if self.summarise_alignments else None
+
+        if metrics is not None:
+            metrics.update_rss()
+
+        client = self.client(host, port)
+        # the bytes of the called read being passed through the sinks and callback
+        result_bytes = 0
+
+        try:
+            while held or not exhausted or done < loaded:
+                if held:
+                    load()
+                    if held and not pending and not inflight:
+                        # nothing of this batch left to free memory, wait for the other workers
+                        read = held.pop()
+                        budget.acquire('loaded', read.signal.nbytes, self.snooze)
+                        queue([read])
+                        load()
+
+                # submit reads
+                while pending:
+                    read = pending.peek(window)
+                    # stop when the window is full or the server queue is
+                    if read is None or not client.pass_read(read):
+                        break
+                    pending.pop()
+                    read.timestamps['submitted'] = perf_counter_ns()
+                    inflight[read.read_id] = read
+                    if budget is not None:
+                        budget.move('loaded', 'inflight', read.signal.nbytes)
+                    if metrics is not None:
+                        metrics.submitted(read.total_samples)
+                    if window is not None:
+                        window.submitted(read.read_id)
+
+                if drained is None and exhausted and not held and not pending:
+                    drained = perf_counter()
+
+                # poll to collect called reads
                 res = client._get_called_read()
 
                 if res is None:
@@ -86,9 +408,140 @@ class Caller:
 
                 done += 1
                 read, called = res
+                read_id = read['metadata']['read_id']
                 samples += called.trimmed_samples
 
+                sent = inflight.pop(read_id, None)
+                if budget is not None:
+                    if sent is not None:
+                        budget.release('inflight', sent.signal.nbytes)
+                    # the result is held until every sink and the callback are done with it
+                    result_bytes = _called_nbytes(called)
+                    budget.try_acquire('pending', result_bytes, force=True)
+
+                if window is not None:
+                    window.completed(read_id, called.trimmed_samples)
+                pending.completed(read_id)
+
+                if states is not None and called.state is not None:
+                    called.state = states.write(read_id, called.state)
+
+                if writer is not None:
+                    writer.write_called(read_id, called)
+
+                if alignments is not None:
+                    alignments.add(called.alignment)
+
+                if summary is not None:
+                    summary.add_called(read, called, sent)
+
                 if self.callback:
                     self.callback(read, called, self.lock)
 
-        return samples
+                if budget is not None:
+                    budget.release('pending', result_bytes)
+                    result_bytes = 0
+
+                if self.client_scaling and sent is not None and sent.scaling_override is None:
+                    expected = read_scaling(sent, signal_start(sent, called))
+                    if check_scaling(expected, called.scaling) is False:
+                        logger.warning("%s: client scaling %s but the server reports %s",
+                                       read_id, expected, called.scaling)
+                if sent is not None:
+                    sent.timestamps['completed'] = client.completed_ns
+                    sent.timestamps['decoded'] = client.decoded_ns
+                    sent.timestamps['done'] = perf_counter_ns()
+                    latency.record_read(sent.timestamps)
+
+                if metrics is not None:
+                    # raw samples like `submitted` so the two counters compare
+                    if sent is not None:
+                        metrics.completed(sent.total_samples, sent.timestamps)
+                    else:
+                        metrics.completed(0)
+                    if done % 100 == 0:
+                        metrics.update_rss()
+        except Exception:
+            # the server may still hold reads of this batch so start afresh
+            _disconnect(_clients.pop(self._client_key(host, port)))
+            raise
+        finally:
+            # reads never submitted or never returned to this client, or a result the callback raised on
+            if window is not None:
+                window.forget(inflight)
+            if budget is not None:
+                budget.release('loaded', sum(read.signal.nbytes for read in pending))
+                budget.release('inflight', sum(read.signal.nbytes for read in inflight.values()))
+                budget.release('pending', result_bytes)
+
+        drain = perf_counter() - drained if drained is not None else 0.0
+        deadlines = {'met': dict(pending.met), 'missed': dict(pending.missed)}
+        return samples, latency, drain, deadlines, alignments
+
+    def report(self):
+        """
+        The p50/p95/p99 latency of each read lifecycle stage of the completed
+        batches and the idle time at the end of the run.
+        """
+        lines = [self.latency.format()]
+        lines.append("%s policy: %.3fs end of run idle, %.3fs batch drain" % (self.policy, self.idle, self.drain))
+        for level in sorted(set(self.deadlines['met']) | set(self.deadlines['missed']), reverse=True):
+            lines.append("priority %s: %s deadlines met, %s missed" % (
+                level, self.deadlines['met'][level], self.deadlines['missed'][level]
+            ))
+        if self.memory is not None:
+            lines.append(self.memory.format())
+        if self.alignments is not None:
+            lines.append(self.alignments.format())
+        return "\n".join(lines)
+
+    def _client_key(self, host, port):
+        return self.config, self.transport, host, port
+
+    def client(self, host, port):
+        """
+        The connected client of this process for the server at `host:port`.
+
+        Clients are created and connected on first use, in the worker
+        initializer for a process pool, then reused for every batch and
+        disconnected when the process exits.
+        """
+        key = self._client_key(host, port)
+        if key not in _clients:
+            queued = self.max_inflight if self.adaptive else 10000
+            client = GuppyBasecallerClient(
+                config_name=self.config, host=host, port=port, max_reads_queued=queued, transport=self.transport,
+                state=self.states is not None,
+            )
+            client.connect()
+            if not _clients:
+                Finalize(None, _disconnect_clients, exitpriority=10)
+            _clients[key] = client
+        return _clients[key]
+
+    def sink(self, writer):
+        """
+        This process's copy of the output sink `writer`, `demux` or `summary`, created
+        on first use and closed, writing out its buffers, when the process exits.
+        """
+        if writer is None:
+            return
+        key = repr(writer)
+        if key not in _writers:
+            writer = copy(writer)
+            writer.lock = getattr(self, "lock", None)
+            if not _writers:
+                Finalize(None, _close_writers, exitpriority=10)
+            _writers[key] = writer
+        return _writers[key]
+
+    def window(self, host, port):
+        """
+        The adaptive in-flight window of this process for the server at `host:port`.
+        """
+        if not self.adaptive:
+            return
+        key = (host, port)
+        if key not in _windows:
+            _windows[key] = AdaptiveWindow(initial=self.inflight, maximum=self.max_inflight)
+        return _windows[key]
@@ -6,41 +6,76 @@ import time
 import asyncio
 import logging
 from collections import deque
+from time import perf_counter, perf_counter_ns
 
 import zmq
 import zmq.asyncio
 from zmq.error import Again
-from zmq import Context, REQ, LINGER, RCVTIMEO
+from zmq import Context, Poller, REQ, LINGER, POLLIN
 
 from pyguppyclient.utils import parse_config
 from pyguppyclient.ipc import simple_request, simple_response
 from pyguppyclient.ipc import SimpleRequestType, SimpleReplyType
+from pyguppyclient.stats import server_stats
+from pyguppyclient.codec import ReadBlockEncoder
 from pyguppyclient.decode import Config, PROTO_VERSION, pcl_called_read
 from pyguppy_client_lib.client_lib import GuppyClient as PCLClient
 
 
 logger = logging.getLogger("pyguppyclient")
 
+TRANSPORTS = ("pcl", "zmq")
+
+
+class ReplyTimeout(TimeoutError, Again):
+    """
+    No reply from the server within the request timeout.
+
+    Both a `TimeoutError` and the `zmq.Again` previously raised once the
+    receive retries ran out, so existing handlers of either still work.
+    """
+
 
 class GuppyClientBase:
     """
     Blocking Guppy Base Client
+
+    Reads are passed and collected through `pyguppy_client_lib` by default,
+    `transport="zmq"` selects the native transport which speaks the same
+    IPC protocol over the client's own REQ socket, sending the raw signal
+    and receiving called blocks as zero-copy frames. The outputs of the
+    native transport are those enabled in the server config, `state` and
+    `trace` can only be requested with `pyguppy_client_lib`.
+
+    Replies are waited for with a poller so they are picked up as soon as
+    they arrive, a request without a reply within `request_timeout` seconds,
+    `timeout * retries` by default, raises a `ReplyTimeout`.
     """
-    def __init__(self, config_name, host="localhost", port=5555, timeout=0.1, retries=50, state=False, trace=False):
+    def __init__(self, config_name, host="localhost", port=5555, timeout=0.1, retries=50, state=False, trace=False,
+                 max_reads_queued=10000, transport="pcl", request_timeout=None):
+        if transport not in TRANSPORTS:
+            raise ValueError("Unknown transport '{}', expected one of {}".format(transport, TRANSPORTS))
+        if transport == "zmq" and (state or trace):
+            raise ValueError("State and trace data can't be requested over the zmq transport, use the pcl transport")
         self.timeout = timeout
         self.retries = retries
+        self.request_timeout = timeout * retries if request_timeout is None else request_timeout
+        self.transport = transport
         self.config_name = parse_config(config_name)
         self.address = "%s:%s" % (host, port)
         self.context = Context()
-        self.socket = self.context.socket(REQ)
-        self.socket.set(LINGER, 0)
-        self.socket.set(RCVTIMEO, 100)
-        self.socket.connect("tcp://%s" % self.address)
+        self.poller = Poller()
+        self._open_socket()
         self.client_id = 0
-        self.pcl_client = PCLClient(self.address, self.config_name)
-        self.pcl_client.set_params({'state_data_enabled': state})
-        self.pcl_client.set_params({'move_and_trace_enabled': trace})
-        _init_pcl_client(self.pcl_client)
+        self.pcl_client = None
+        self.encoder = None
+        if transport == "zmq":
+            self.encoder = ReadBlockEncoder()
+        else:
+            self.pcl_client = PCLClient(self.address, self.config_name)
+            self.pcl_client.set_params({'state_data_enabled': state})
+            self.pcl_client.set_params({'move_and_trace_enabled': trace})
+            _init_pcl_client(self.pcl_client, max_reads_queued)
 
     def __enter__(self):
         self.connect()
@@ -49,30 +84,51 @@ class GuppyClientBase:
     def __exit__(self, exception_type, exception_value, traceback):
         self.disconnect()
 
-    def send(self, message, data=None, text=None, simple=True):
+    def _open_socket(self):
+        self.socket = self.context.socket(REQ)
+        self.socket.set(LINGER, 0)
+        self.socket.connect("tcp://%s" % self.address)
+        self.poller.register(self.socket, POLLIN)
+
+    def _reset_socket(self):
+        """
+        Replace the socket, a REQ socket that missed its reply can't send again.
+        """
+        self.poller.unregister(self.socket)
+        self.socket.close()
+        self._open_socket()
+
+    def send(self, message, data=None, text=None, simple=True, copy=True, timeout=None):
+        """
+        Send a request and decode its reply.
+
+        :param timeout: the seconds to wait for the reply, defaults to `request_timeout`.
+        """
         if simple:
             request = simple_request(message, client_id=self.client_id, text=text, data=data)
         else:
             request = message
-        try:
-            self.socket.send(request)
-        except Again:
-            self.socket.send(request)
+        self.socket.send(request, copy=copy)
+        return simple_response(self.recv(copy=copy, timeout=timeout))
 
-        return simple_response(self.recv())
+    def recv(self, copy=True, timeout=None):
+        """
+        Receive a reply, with `copy=False` a memoryview of the zmq frame.
 
-    def recv(self):
-        for _ in range(self.retries):
-            try:
-                message = self.socket.recv()
-                break
-            except Again:
-                time.sleep(self.timeout)
-        else:
-            raise Again()
-        return message
+        :param timeout: the seconds to wait for the reply, defaults to `request_timeout`.
+        """
+        timeout = self.request_timeout if timeout is None else timeout
+        deadline = perf_counter() + timeout
+        while not self.poller.poll(max(deadline - perf_counter(), 0) * 1000):
+            if perf_counter() >= deadline:
+                self._reset_socket()
+                raise ReplyTimeout("No reply from {} within {:.3f}s".format(self.address, timeout))
+        message = self.socket.recv(copy=copy)
+        return message if copy else message.buffer
 
     def connect(self):
+        if self.transport == "zmq":
+            return self._connect_zmq()
         result = self.pcl_client.result
         ret = self.pcl_client.connect()
         if ret == result.already_connected:
@@ -84,7 +140,26 @@ class GuppyClientBase:
                 )
             )
 
+    def _connect_zmq(self):
+        for _ in range(self.retries):
+            try:
+                res = self.send(SimpleRequestType.CONNECT, text=self.config_name)
+            except ValueError:
+                raise ConnectionError("Connect with '{}' failed: invalid config".format(self.config_name))
+            if res.Type() == SimpleReplyType.CONNECTED:
+                self.client_id = res.Data()
+                return
+            if res.Type() != SimpleReplyType.LOADING_CONFIG:
+                raise ConnectionError("Connect with '{}' failed: {}".format(self.config_name, res.Text()))
+            time.sleep(self.timeout)
+        raise ConnectionError("Connect with '{}' failed: config not loaded".format(self.config_name))
+
     def disconnect(self):
+        if self.transport == "zmq":
+            if self.client_id:
+                self.send(SimpleRequestType.DISCONNECT)
+                self.client_id = 0
+            return
         return self.pcl_client.disconnect()
 
     def shut_down(self):
@@ -95,9 +170,17 @@ class GuppyClientBase:
         return [res.Configs(i) for i in range(res.ConfigsLength())]
 
     def get_statistics(self):
+        if self.transport == "zmq":
+            return server_stats(self.send(SimpleRequestType.GET_STATISTICS))
         return self.pcl_client.get_server_stats(self.address, 5)
 
     def pass_read(self, read):
+        """
+        Pass a `ReadData` object to the server, returns `False` if the server isn't ready for it.
+        """
+        if self.transport == "zmq":
+            res = self.send(self.encoder.encode_read(self.client_id, read), simple=False, copy=False)
+            return res.Type() == SimpleReplyType.RAW_BLOCK_ACCEPTED
         read_dict = {
             "read_tag": int(read.read_tag),
             "read_id": str(read.read_id),
@@ -115,6 +198,8 @@ class GuppyBasecallerClient(GuppyClientBase):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.read_cache = deque()
+        self.completed_ns = None
+        self.decoded_ns = None
 
     def basecall(self, read):
         """
@@ -136,17 +221,64 @@ class GuppyBasecallerClient(GuppyClientBase):
     def _get_called_read(self):
         """
         Get the `CalledReadData` object back from the server
+
+        The `perf_counter_ns` timestamps of the returned read being seen in the
+        completed reads and decoded are kept in `completed_ns` and `decoded_ns`.
         """
+        if self.transport == "zmq":
+            return self._get_called_block()
+
         if len(self.read_cache) == 0:
             reads = self.pcl_client.get_completed_reads()
+            self.completed_ns = perf_counter_ns()
             self.read_cache.extend(reads)
 
         try:
             read = self.read_cache.pop()
-            return read, pcl_called_read(read)
         except IndexError:
             return
 
+        called = pcl_called_read(read)
+        self.decoded_ns = perf_counter_ns()
+        return read, called
+
+    def _get_called_block(self):
+        """
+        Get the next called read from the server over the native transport.
+        """
+        self.socket.send(simple_request(SimpleRequestType.GET_FIRST_CALLED_BLOCK, client_id=self.client_id))
+        message = self.recv(copy=False)
+        self.completed_ns = perf_counter_ns()
+
+        res = simple_response(message)
+        if not isinstance(res, tuple):
+            # NONE_PENDING or NOT_READY
+            return
+
+        read, called = res
+        waits = 0
+        while not called.complete:
+            res = self.send(SimpleRequestType.GET_NEXT_CALLED_BLOCK, data=read['read_tag'], copy=False)
+            if isinstance(res, tuple):
+                called += res[1]
+                continue
+            if res is None:
+                raise ConnectionError(
+                    "Server has no further blocks for incomplete read '{}'".format(read['metadata']['read_id'])
+                )
+            # NOT_READY, the next block is still being sent
+            waits += 1
+            if waits >= self.retries:
+                raise TimeoutError(
+                    "Next block not received after {}s for read '{}'".format(
+                        self.timeout * waits, read['metadata']['read_id']
+                    )
+                )
+            time.sleep(self.timeout)
+
+        self.decoded_ns = perf_counter_ns()
+        return read, called
+
 
 class GuppyAsyncClientBase:
     """
@@ -234,7 +366,7 @@ class GuppyAsyncClientBase:
             return
 
 
-def _init_pcl_client(pcl_client):
+def _init_pcl_client(pcl_client, max_reads_queued=10000):
     """
     Perform basic initialisation of a pyguppy_client_lib client.
     """
@@ -246,6 +378,6 @@ def _init_pcl_client(pcl_client):
                         "pyguppy_client_lib.".format(pcl_proto_major_version,
                                                      PROTO_VERSION[0]))
     params = {
-        "max_reads_queued": 10000  # Number of reads the pcl_client can hold
+        "max_reads_queued": max_reads_queued  # Number of reads the pcl_client can hold
     }
     pcl_client.set_params(params)
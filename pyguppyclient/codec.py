@@ -0,0 +1,228 @@
+"""
+pyguppyclient fast path codec for simple messages
+"""
+
+from struct import Struct
+from functools import lru_cache
+
+import numpy as np
+from flatbuffers import Builder
+
+from pyguppyclient.decode import PROTO_VERSION, set_file_identifier
+
+from pyguppyclient.guppy_ipc.Content import Content
+import pyguppyclient.guppy_ipc.MessageData as MessageData
+import pyguppyclient.guppy_ipc.ReadBlockData as ReadBlockData
+import pyguppyclient.guppy_ipc.SimpleRequestData as SimpleRequestData
+import pyguppyclient.guppy_ipc.ScalingOverrideData as ScalingOverrideData
+from pyguppyclient.guppy_ipc.ReadBlockType import ReadBlockType
+from pyguppyclient.guppy_ipc.SimpleRequestType import SimpleRequestType
+from pyguppyclient.guppy_ipc.ProtocolVersion import CreateProtocolVersion
+
+
+_uoffset = Struct('<I')
+_soffset = Struct('<i')
+_voffset = Struct('<H')
+_uint8 = Struct('<B')
+_uint32 = Struct('<I')
+
+# the vtable of MessageData is its size, the table size and the four field offsets
+_message_vtable = Struct('<6H')
+# the vtable of SimpleRequestData and SimpleReplyData, type, data and text
+_simple_vtable = Struct('<5H')
+
+# flatbuffers before 2.0 need the element count to end a vector
+_END_VECTOR_COUNT = 'vectorNumElems' in Builder.EndVector.__code__.co_varnames
+
+
+def encode_simple(request_type, client_id=0, text=None, data=None):
+    """
+    Encode a `SimpleRequestData` message with the generated flatbuffers helpers.
+    """
+    builder = Builder(64)
+
+    if text is not None:
+        text = builder.CreateString(text)
+
+    SimpleRequestData.SimpleRequestDataStart(builder)
+    SimpleRequestData.SimpleRequestDataAddType(builder, request_type)
+    if text is not None:
+        SimpleRequestData.SimpleRequestDataAddText(builder, text)
+    if data is not None:
+        SimpleRequestData.SimpleRequestDataAddData(builder, data)
+    content = SimpleRequestData.SimpleRequestDataEnd(builder)
+
+    MessageData.MessageDataStart(builder)
+    MessageData.MessageDataAddVersion(builder, CreateProtocolVersion(builder, *PROTO_VERSION))
+    MessageData.MessageDataAddSenderId(builder, client_id)
+    MessageData.MessageDataAddContentType(builder, Content.SimpleRequestData)
+    MessageData.MessageDataAddContent(builder, content)
+    builder.Finish(MessageData.MessageDataEnd(builder))
+
+    return set_file_identifier(builder.Output())
+
+
+@lru_cache(maxsize=1024)
+def constant_request(request_type, client_id=0):
+    """
+    The pre-encoded, immutable buffer of a request without text or data.
+
+    >>> constant_request(SimpleRequestType.GET_STATISTICS, 7) is constant_request(SimpleRequestType.GET_STATISTICS, 7)
+    True
+    >>> decode_header(constant_request(SimpleRequestType.GET_STATISTICS, 7))[:3]
+    (7, 7, 1)
+    """
+    return bytes(encode_simple(request_type, client_id))
+
+
+def _fields(buff, table, vtable_struct, count):
+    """
+    The field offsets of the table at `table`, zero for absent fields.
+    """
+    vtable = table - _soffset.unpack_from(buff, table)[0]
+    vsize = _voffset.unpack_from(buff, vtable)[0]
+    if vsize == vtable_struct.size:
+        return vtable_struct.unpack_from(buff, vtable)[2:]
+    # a vtable written by another encoder may omit trailing fields
+    return tuple(
+        _voffset.unpack_from(buff, vtable + 4 + 2 * i)[0] if 4 + 2 * i < vsize else 0 for i in range(count)
+    )
+
+
+def decode_header(buff):
+    """
+    Decode the `MessageData` header of `buff` without building any table objects.
+
+    :returns: a tuple of the major version, sender id, content type and the
+              position of the content table in `buff`.
+    """
+    table = _uoffset.unpack_from(buff, 0)[0]
+    version, sender, content_type, content = _fields(buff, table, _message_vtable, 4)
+    major = _uint32.unpack_from(buff, table + version)[0] if version else 0
+    sender = _uint32.unpack_from(buff, table + sender)[0] if sender else 0
+    content_type = _uint8.unpack_from(buff, table + content_type)[0] if content_type else Content.NONE
+    if content:
+        content = table + content + _uoffset.unpack_from(buff, table + content)[0]
+    return major, sender, content_type, content
+
+
+def decode_simple(buff, pos):
+    """
+    Decode the `SimpleRequestData` or `SimpleReplyData` table at `pos`.
+
+    :returns: a tuple of the message type, data and text.
+    """
+    kind, data, text = _fields(buff, pos, _simple_vtable, 3)
+    kind = _uint32.unpack_from(buff, pos + kind)[0] if kind else 0
+    data = _uint32.unpack_from(buff, pos + data)[0] if data else 0
+    if text:
+        start = pos + text + _uoffset.unpack_from(buff, pos + text)[0]
+        length = _uoffset.unpack_from(buff, start)[0]
+        text = bytes(buff[start + 4:start + 4 + length])
+    else:
+        text = None
+    return kind, data, text
+
+
+class ReadBlockEncoder:
+    """
+    Encoder of raw signal `ReadBlockData` messages reusing a single buffer.
+
+    The signal is written into the builder with one numpy copy rather than
+    prepended sample by sample and the buffer is kept between messages,
+    only growing when a longer read arrives. The returned message is a view
+    of that buffer so it is only valid until the next call to `encode`.
+
+    :param size: the initial size of the buffer in bytes.
+
+    >>> encoder = ReadBlockEncoder(size=64)
+    >>> message = encoder.encode(7, 1, "read", np.arange(100, dtype=np.int16), 2.0, 0.5, scaling_override=(80.0, 10.0))
+    >>> block = ReadBlockData.ReadBlockData()
+    >>> major, sender, content_type, pos = decode_header(message)
+    >>> block.Init(message, pos)
+    >>> sender, block.ReadId(), block.RawDataAsNumpy()[-3:].tolist(), block.TotalSamples(), block.DaqScaling()
+    (7, b'read', [97, 98, 99], 100, 0.5)
+    >>> block.ScalingOverride().ScalingOverrideMedAbsDev()
+    10.0
+    """
+    def __init__(self, size=2**20):
+        self.buffer = bytearray(size)
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, len(self.buffer))
+
+    def _builder(self, nbytes):
+        """
+        A builder over the reused buffer, grown once up front to fit `nbytes` of signal.
+        """
+        if len(self.buffer) < nbytes + 1024:
+            self.buffer = bytearray(2 ** (nbytes + 1024).bit_length())
+        builder = Builder(0)
+        builder.Bytes = self.buffer
+        builder.head = len(self.buffer)
+        return builder
+
+    def encode(self, client_id, read_tag, read_id, signal, daq_offset=0.0, daq_scaling=1.0,
+               block_index=0, total_blocks=1, total_samples=None, scaling_override=None,
+               block_type=ReadBlockType.PASS_FIRST_RAW_BLOCK):
+        """
+        Encode a block of raw signal.
+
+        :param signal: the int16 raw signal of the block.
+        :param total_samples: the samples in the whole read, defaults to the length of `signal`.
+        :param scaling_override: an optional `(median, med_abs_dev)` for the server to
+                                 use in place of its own signal scaling.
+        :returns: a memoryview of the encoded message.
+        """
+        count = len(signal)
+        nbytes = 2 * count
+        builder = self._builder(nbytes)
+
+        # the raw data vector, written directly into the builder's buffer
+        builder.StartVector(2, count, 2)
+        builder.head = builder.Head() - nbytes
+        np.frombuffer(builder.Bytes, dtype='<i2', count=count, offset=builder.Head())[:] = signal
+        raw = builder.EndVector(count) if _END_VECTOR_COUNT else builder.EndVector()
+
+        read_id = builder.CreateString(read_id)
+
+        if scaling_override is not None:
+            median, med_abs_dev = scaling_override
+            ScalingOverrideData.ScalingOverrideDataStart(builder)
+            ScalingOverrideData.ScalingOverrideDataAddScalingOverrideMedian(builder, float(median))
+            ScalingOverrideData.ScalingOverrideDataAddScalingOverrideMedAbsDev(builder, float(med_abs_dev))
+            scaling_override = ScalingOverrideData.ScalingOverrideDataEnd(builder)
+
+        ReadBlockData.ReadBlockDataStart(builder)
+        ReadBlockData.ReadBlockDataAddType(builder, block_type)
+        ReadBlockData.ReadBlockDataAddReadTag(builder, int(read_tag))
+        ReadBlockData.ReadBlockDataAddBlockIndex(builder, block_index)
+        ReadBlockData.ReadBlockDataAddTotalBlocks(builder, total_blocks)
+        ReadBlockData.ReadBlockDataAddTotalSamples(builder, count if total_samples is None else int(total_samples))
+        ReadBlockData.ReadBlockDataAddDaqOffset(builder, float(daq_offset))
+        ReadBlockData.ReadBlockDataAddDaqScaling(builder, float(daq_scaling))
+        ReadBlockData.ReadBlockDataAddReadId(builder, read_id)
+        ReadBlockData.ReadBlockDataAddRawData(builder, raw)
+        if scaling_override is not None:
+            ReadBlockData.ReadBlockDataAddScalingOverride(builder, scaling_override)
+        content = ReadBlockData.ReadBlockDataEnd(builder)
+
+        MessageData.MessageDataStart(builder)
+        MessageData.MessageDataAddVersion(builder, CreateProtocolVersion(builder, *PROTO_VERSION))
+        MessageData.MessageDataAddSenderId(builder, client_id)
+        MessageData.MessageDataAddContentType(builder, Content.ReadBlockData)
+        MessageData.MessageDataAddContent(builder, content)
+        builder.Finish(MessageData.MessageDataEnd(builder))
+
+        # the builder only grows the buffer if the fixed size estimate was short
+        self.buffer = builder.Bytes
+        return set_file_identifier(memoryview(builder.Bytes)[builder.Head():])
+
+    def encode_read(self, client_id, read):
+        """
+        Encode a `ReadData` as a single block including its `scaling_override`.
+        """
+        return self.encode(
+            client_id, read.read_tag, read.read_id, read.signal, read.daq_offset, read.daq_scaling,
+            scaling_override=read.scaling_override,
+        )
@@ -16,6 +16,23 @@ from pyguppyclient.guppy_ipc.ProtocolVersion import CreateProtocolVersion
 
 PROTO_VERSION = (7, 0, 0)
 
+# the fields of an alignment and their numpy dtype, genome names are kept as a list
+ALIGNMENT_FIELDS = {
+    'genome': None,
+    'genome_start': np.int64,
+    'genome_end': np.int64,
+    'strand_start': np.int64,
+    'strand_end': np.int64,
+    'direction': 'U1',
+    'num_aligned': np.int32,
+    'num_correct': np.int32,
+    'num_insertions': np.int32,
+    'num_deletions': np.int32,
+    'identity': np.float32,
+    'accuracy': np.float32,
+    'coverage': np.float32,
+}
+
 
 class Config:
     """
@@ -39,6 +56,11 @@ class ReadData:
     :param read_id: unique identifier for the `read`.
     :param offset: the channel offset value.
     :param scaling: the channel scaling value.
+
+    The optional `scaling_override`, a `(median, med_abs_dev)` in pA set by
+    `scaling.scale_reads`, is sent for the server to use in place of its own.
+    The `filename`, `run_id`, `channel`, `start_time` in samples and
+    `sampling_rate` of the read are set by `io.yield_reads`.
     """
     def __init__(self, signal, read_id, offset=0, scaling=1.0):
         self.signal = signal
@@ -49,6 +71,13 @@ class ReadData:
         self.block_index = None
         self.total_blocks = None
         self.read_tag = random.randint(0, int(2**32 - 1))
+        self.scaling_override = None
+        self.filename = None
+        self.run_id = None
+        self.channel = None
+        self.start_time = None
+        self.sampling_rate = None
+        self.timestamps = dict()
 
     def __repr__(self):
         return "%s" % (self.__class__.__name__)
@@ -63,22 +92,28 @@ class CalledReadData:
     :param qual: the per base quality string for the call.
     :param qscore: the median quality score.
     :param events: the number of timesteps output.
-    :param state: the full posterior probabilities from the network prior to decoding.
+    :param state: the full posterior probabilities from the network prior to decoding,
+                  or the `io.StateHandle` of them once written to a `StateStore`.
     :param state_size: the number of features in the posterior output.
     :param model_type: the type of model used for basecalling.
     :param model_stride: the model stride.
     :param trimmed_samples: the number of samples discarded for the basecall.
     :param move: the move table for aligning the call sequence back to the signal.
     :param trace: the flipflip trace table.
-    :param mod_probs: the modified base probabilities.
+    :param mod_probs: the modified base probabilities in [0, 1], scaled from
+                      `base_mod_probs` on first use when not given.
     :param mod_alphabet: a string containing the model labels.
     :param mod_long_names: a list of modified base long names.
+    :param alignment: the alignments of the read as a dict of arrays, see `ALIGNMENT_FIELDS`.
+    :param base_mod_probs: the uint8 modified base probabilities as sent by the server, a
+                           row per base and a column per `mod_alphabet` label, see `modbase`.
     """
     def __init__(
             self, seq, qual, events, seqlen, state_size,  model_type,
             trimmed_samples, model_stride, qscore, state=None, move=None,
             weight=None, trace=None, mod_alpha=None, mod_probs=None,
-            long_names=None, barcode=None, scaling=None, complete=True
+            long_names=None, barcode=None, scaling=None, complete=True, alignment=None,
+            base_mod_probs=None
     ):
         self.seq = seq
         self.qual = qual
@@ -96,13 +131,25 @@ class CalledReadData:
         self.barcode = barcode
         self.scaling = scaling
         self.complete = complete
-        self.mod_probs = mod_probs
+        self.base_mod_probs = base_mod_probs
+        self._mod_probs = mod_probs
         self.mod_alphabet = mod_alpha
         self.mod_long_names = long_names
+        self.alignment = alignment
 
     def __repr__(self):
         return '%s' % (self.__class__.__name__)
 
+    @property
+    def mod_probs(self):
+        if self._mod_probs is None and self.base_mod_probs is not None:
+            self._mod_probs = self.base_mod_probs * (1.0 / 255.0)
+        return self._mod_probs
+
+    @mod_probs.setter
+    def mod_probs(self, mod_probs):
+        self._mod_probs = mod_probs
+
     def _concat(self, a, b):
         if isinstance(a, np.ndarray):
             return np.concatenate([a, b])
@@ -116,7 +163,13 @@ class CalledReadData:
         self.move = self._concat(self.move, other.move)
         self.weight = self._concat(self.weight, other.weight)
         self.trace =  self._concat(self.trace, other.trace)
-        self.mod_probs = self._concat(self.mod_probs, other.mod_probs)
+        if self.base_mod_probs is not None:
+            self.base_mod_probs = self._concat(self.base_mod_probs, other.base_mod_probs)
+            self._mod_probs = None
+        else:
+            self.mod_probs = self._concat(self.mod_probs, other.mod_probs)
+        if other.alignment is not None:
+            self.alignment = other.alignment
         return self
 
 
@@ -154,11 +207,10 @@ def pcl_called_read(pcl_read):
             'runlength': datasets.get('rle_runlength'),
         }
 
-    mod_probs = datasets.get('base_mod_probs')
+    base_mod_probs = datasets.get('base_mod_probs')
     mod_alpha = None
     long_names = None
-    if mod_probs is not None:
-        mod_probs = mod_probs * (1.0 / 255.0)
+    if base_mod_probs is not None:
         mod_alpha = metadata.get('base_mod_alphabet')
         long_names = metadata.get('base_mod_long_names')
 
@@ -213,10 +265,17 @@ def pcl_called_read(pcl_read):
 
     complete = True
 
+    # pyguppy_client_lib reports the primary alignment, `*` when unaligned
+    alignment = None
+    if metadata.get('alignment_genome') not in (None, '*'):
+        alignment = alignment_arrays([
+            tuple(metadata.get('alignment_%s' % name, '' if name == 'direction' else 0) for name in ALIGNMENT_FIELDS)
+        ])
+
     return CalledReadData(seq, qual, events, seqlen, state_size,  model_type,
                       trimmed_samples, model_stride, qscore, state, move,
-                      weight, trace, mod_alpha, mod_probs,
-                      long_names, barcode, scaling, complete)
+                      weight, trace, mod_alpha, None,
+                      long_names, barcode, scaling, complete, alignment, base_mod_probs)
 
 
 def set_file_identifier(buff):
@@ -226,3 +285,168 @@ def set_file_identifier(buff):
     buff[4:8] = b'%04x' % PROTO_VERSION[0]
     return buff
             
+
+
+def _numpy(array):
+    """
+    The generated `*AsNumpy` accessors return 0 for an absent vector.
+    """
+    return array if isinstance(array, np.ndarray) else None
+
+
+def _string(value):
+    return value.decode() if value is not None else None
+
+
+def alignment_arrays(rows):
+    """
+    Columns of the `ALIGNMENT_FIELDS` tuples `rows`, a list of genome names
+    and a numpy array of each numeric field.
+
+    >>> alignment = alignment_arrays([('chr1', 10, 90, 1, 81, '+', 75, 70, 2, 3, 0.93, 0.9, 0.98)])
+    >>> alignment['genome'], alignment['genome_end'].tolist(), alignment['identity'].dtype
+    (['chr1'], [90], dtype('float32'))
+    """
+    columns = dict(zip(ALIGNMENT_FIELDS, zip(*rows))) if rows else dict.fromkeys(ALIGNMENT_FIELDS, ())
+    return {
+        name: list(values) if ALIGNMENT_FIELDS[name] is None else np.array(values, dtype=ALIGNMENT_FIELDS[name])
+        for name, values in columns.items()
+    }
+
+
+def alignment_results(called):
+    """
+    The `AlignmentResults` vector of a `CalledBlockData` as `alignment_arrays`, `None` without alignments.
+    """
+    count = called.AlignmentResultsLength()
+    if not count:
+        return
+    rows = []
+    for result in (called.AlignmentResults(i) for i in range(count)):
+        direction = result.Direction()
+        rows.append((
+            _string(result.Genome()), result.GenomeStart(), result.GenomeEnd(),
+            result.StrandStart(), result.StrandEnd(), chr(direction) if direction else '',
+            result.NumAligned(), result.NumCorrect(), result.NumInsertions(), result.NumDeletions(),
+            result.Identity(), result.Accuracy(), result.Coverage(),
+        ))
+    return alignment_arrays(rows)
+
+
+def called_read_block(res):
+    """
+    Decode a called `ReadBlockData` message returned from guppy_basecall_server.
+
+    The move table, state data, runlength trace and modified base probabilities
+    are `*AsNumpy` views of the message buffer rather than copies, the flipflop
+    trace is shaped `(events, states)` and scaled to [0, 1] as with `pcl_called_read`.
+
+    :param res: the `MessageData` of the message.
+    :returns: a tuple of a read dict in the layout of `pyguppy_client_lib`
+              reads, carrying only the metadata, and a `CalledReadData`.
+    """
+    block = ReadBlockData.ReadBlockData()
+    block.Init(res.Content().Bytes, res.Content().Pos)
+    called = block.CalledData()
+
+    read_id = _string(block.ReadId())
+    total_samples = block.TotalSamples()
+    state_size = called.StateSize()
+
+    state = _numpy(called.StateDataAsNumpy())
+    if state is not None and state_size:
+        state = state.reshape(-1, state_size)
+
+    move = None
+    trace = None
+    if called.TraceResultsType() == TraceData.TraceData.FlipflopTraceData:
+        table = called.TraceResults()
+        flipflop = FlipflopTraceData.FlipflopTraceData()
+        flipflop.Init(table.Bytes, table.Pos)
+        move = _numpy(flipflop.MoveDataAsNumpy())
+        trace = _numpy(flipflop.TraceDataAsNumpy())
+        if trace is not None:
+            # a flat vector on the wire, an (events, states) array as from pyguppy_client_lib
+            events = called.BlockEvents()
+            if events:
+                trace = trace.reshape(events, -1)
+            trace = trace * (1.0 / 255.0)
+    elif called.TraceResultsType() == TraceData.TraceData.RunlengthTraceData:
+        table = called.TraceResults()
+        runlength = RunlengthTraceData.RunlengthTraceData()
+        runlength.Init(table.Bytes, table.Pos)
+        trace = {
+            'base': _numpy(runlength.BaseAsNumpy()),
+            'shape': _numpy(runlength.ShapeAsNumpy()),
+            'scale': _numpy(runlength.ScaleAsNumpy()),
+            'weight': _numpy(runlength.WeightAsNumpy()),
+            'index': _numpy(runlength.IndexAsNumpy()),
+            'runlength': _numpy(runlength.RunlengthAsNumpy()),
+        }
+
+    base_mod_probs = None
+    mod_alpha = None
+    long_names = None
+    base_mods = called.BaseModResults()
+    if base_mods is not None:
+        base_mod_probs = _numpy(base_mods.ModProbsAsNumpy())
+        mod_alpha = _string(base_mods.Alphabet())
+        long_names = _string(base_mods.LongNames())
+        if base_mod_probs is not None and mod_alpha:
+            base_mod_probs = base_mod_probs.reshape(-1, len(mod_alpha))
+
+    barcode = None
+    arrangement = called.BarcodeResults()
+    if arrangement is not None:
+        barcode = {
+            'trim_front': arrangement.BarcodeTrimFront(),
+            'trim_rear': arrangement.BarcodeTrimRear(),
+            'id': _string(arrangement.Id()),
+            'normalized_id': _string(arrangement.NormalisedId()),
+            'kit': _string(arrangement.Kit()),
+            'variant': _string(arrangement.Variant()),
+            'score': arrangement.Score(),
+        }
+
+    scaling = None
+    results = called.ScalingResults()
+    if results is not None:
+        scaling = {
+            'median': results.Median(),
+            'med_abs_dev': results.MedAbsDev(),
+            'pt_median': results.PtMedian(),
+            'ptsd': results.Ptsd(),
+            'adapter_max': results.AdapterMax(),
+            'pt_detect_success': results.PtDetectSuccess(),
+        }
+
+    block_index = block.BlockIndex()
+    total_blocks = block.TotalBlocks()
+
+    read = {
+        'read_tag': block.ReadTag(),
+        'block_index': block_index,
+        'total_blocks': total_blocks,
+        'metadata': {
+            'read_id': read_id,
+            'read_tag': block.ReadTag(),
+            'duration': total_samples,
+            'trimmed_samples': called.TrimmedSamples(),
+            'sequence_length': called.TotalSequenceLength(),
+            'mean_qscore': called.MeanQscore(),
+            'model_stride': called.ModelStride(),
+            'median': called.Median(),
+            'med_abs_dev': called.MedAbsDev(),
+        },
+        'datasets': {},
+    }
+
+    called_read = CalledReadData(
+        _string(called.Sequence()) or '', _string(called.Qstring()) or '', called.TotalEvents(),
+        called.TotalSequenceLength(), state_size, _string(called.ModelType()),
+        total_samples - called.TrimmedSamples(), called.ModelStride(), called.MeanQscore(),
+        state, move, None, trace, mod_alpha, None, long_names, barcode, scaling,
+        complete=block_index + 1 >= total_blocks, alignment=alignment_results(called),
+        base_mod_probs=base_mod_probs,
+    )
+    return read, called_read
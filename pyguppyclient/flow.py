@@ -0,0 +1,359 @@
+"""
+pyguppyclient flow control
+"""
+
+import multiprocessing
+from math import inf
+from heapq import heappush, heappop
+from time import sleep, perf_counter
+from collections import defaultdict
+
+from pyguppyclient.utils import bases_fmt
+
+
+BUDGET_STAGES = ('loaded', 'inflight', 'pending')
+
+
+class AdaptiveWindow:
+    """
+    An additive increase, multiplicative decrease (AIMD) in-flight read window.
+
+    The window is evaluated once per round, a round being as many completed
+    reads as the window size. The window grows by `increase` reads while the
+    mean completion latency stays within `tolerance` times the lowest latency
+    seen or the completed samples/s is still improving, and shrinks by the
+    factor `decrease` once latency inflates without any gain in throughput,
+    i.e. reads are only queueing on the server.
+
+    :param initial: the initial window size.
+    :param minimum: the smallest window size.
+    :param maximum: the largest window size.
+    :param increase: the number of reads to grow the window by each round.
+    :param decrease: the factor to shrink the window by on congestion.
+    :param tolerance: the latency inflation over the baseline treated as congestion.
+    :param gain: the relative increase in samples/s counted as an improvement.
+
+    >>> window = AdaptiveWindow(initial=4, increase=2, decrease=0.5)
+    >>> window._update(latency=1.0, rate=100.0)
+    >>> window.size
+    6
+    >>> window._update(latency=3.0, rate=100.0)
+    >>> window.size
+    3
+    >>> window.submitted('a'), window.submitted('b'), window.available()
+    (None, None, 1)
+    >>> window.forget(['a', 'b'])
+    >>> window.available()
+    3
+    """
+    def __init__(self, initial=50, minimum=1, maximum=10000, increase=2, decrease=0.5, tolerance=1.5, gain=0.05):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.tolerance = tolerance
+        self.gain = gain
+        self.window = float(min(max(initial, minimum), maximum))
+        self.sent = dict()
+        self.baseline = None
+        self.latency = None
+        self.rate = None
+        self._reset()
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, self.size)
+
+    def __len__(self):
+        return len(self.sent)
+
+    def _reset(self):
+        self.round_start = perf_counter()
+        self.round_reads = 0
+        self.round_samples = 0
+        self.round_latency = 0.0
+
+    @property
+    def size(self):
+        return int(self.window)
+
+    def available(self):
+        """
+        The number of reads that can be submitted without exceeding the window.
+        """
+        return max(self.size - len(self.sent), 0)
+
+    def submitted(self, key):
+        """
+        Record the submission of the read identified by `key`.
+        """
+        self.sent[key] = perf_counter()
+
+    def completed(self, key, samples):
+        """
+        Record the completion of the read identified by `key` with `samples`.
+        """
+        now = perf_counter()
+        start = self.sent.pop(key, None)
+        if start is None:
+            return
+
+        self.round_reads += 1
+        self.round_samples += samples
+        self.round_latency += now - start
+
+        if self.round_reads >= self.size:
+            self._update(self.round_latency / self.round_reads, self.round_samples / max(now - self.round_start, 1e-9))
+            self._reset()
+
+    def forget(self, keys):
+        """
+        Drop the reads identified by `keys` that will never be completed,
+        e.g. those in flight on a client that was disconnected.
+        """
+        for key in keys:
+            self.sent.pop(key, None)
+
+    def _update(self, latency, rate):
+        """
+        Resize the window from the mean `latency` and samples/s `rate` of the last round.
+        """
+        if self.baseline is None or latency < self.baseline:
+            self.baseline = latency
+        else:
+            # let the baseline drift up slowly so a round of short reads can't pin it
+            self.baseline += 0.01 * (latency - self.baseline)
+
+        improving = self.rate is None or rate > self.rate * (1 + self.gain)
+        congested = latency > self.tolerance * self.baseline
+
+        if congested and not improving:
+            self.window = max(self.window * self.decrease, self.minimum)
+        else:
+            self.window = min(self.window + self.increase, self.maximum)
+
+        self.latency = latency
+        self.rate = rate
+
+
+class SubmissionQueue:
+    """
+    A priority and deadline aware queue of reads waiting to be submitted.
+
+    Reads leave the queue highest `priority` first, then earliest deadline,
+    then in the order they were queued. With an in-flight window, `reserve`
+    slots of it, at most all but one, are only given to reads with a priority
+    above zero, so urgent reads are admitted at once while bulk reads fill
+    the rest of the capacity. Reads with a deadline are checked against it
+    on completion and counted per priority in `met` and `missed`.
+
+    :param reserve: the window slots held back for reads with a priority above zero.
+
+    >>> queue = SubmissionQueue()
+    >>> queue.put('bulk', key='bulk')
+    >>> queue.put('qc', priority=1, deadline=60.0, key='qc')
+    >>> queue.put('soon', deadline=0.0, key='soon')
+    >>> [queue.pop() for _ in range(len(queue))]
+    ['qc', 'soon', 'bulk']
+    >>> queue.completed('qc'), queue.completed('soon'), queue.completed('bulk')
+    (True, False, None)
+    >>> dict(queue.met), dict(queue.missed)
+    ({1: 1}, {0: 1})
+    """
+    def __init__(self, reserve=0):
+        self.reserve = reserve
+        self.heap = []
+        self.count = 0
+        self.deadlines = dict()
+        self.met = defaultdict(int)
+        self.missed = defaultdict(int)
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, len(self))
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __iter__(self):
+        return (entry[3] for entry in self.heap)
+
+    def put(self, read, priority=0, deadline=None, key=None):
+        """
+        Queue `read` for submission.
+
+        :param priority: reads with a higher priority are submitted first.
+        :param deadline: the seconds from now by which the read should be completed.
+        :param key: the identifier later passed to `completed`, defaults to `read.read_id`.
+        """
+        due = inf if deadline is None else perf_counter() + deadline
+        heappush(self.heap, (-priority, due, self.count, read))
+        self.count += 1
+        if deadline is not None:
+            self.deadlines[read.read_id if key is None else key] = priority, due
+
+    def peek(self, window=None):
+        """
+        The next read to submit, or `None` if the queue is empty or `window` has no room for it.
+
+        At most all but one slot of the window are reserved, so a window
+        shrunk to `reserve` or below still admits bulk reads one at a time.
+
+        >>> window = AdaptiveWindow(initial=2)
+        >>> queue = SubmissionQueue(reserve=2)
+        >>> queue.put('bulk', key='bulk')
+        >>> queue.peek(window)
+        'bulk'
+        >>> window.submitted(queue.pop())
+        >>> queue.put('more bulk', key='more bulk')
+        >>> queue.peek(window) is None
+        True
+        >>> queue.put('urgent', priority=1, key='urgent')
+        >>> queue.peek(window)
+        'urgent'
+        """
+        if not self.heap:
+            return
+        if window is not None:
+            available = window.available()
+            reserve = min(self.reserve, window.size - 1)
+            if available == 0 or (available <= reserve and self.heap[0][0] >= 0):
+                return
+        return self.heap[0][3]
+
+    def pop(self):
+        """
+        Remove and return the next read to submit.
+        """
+        return heappop(self.heap)[3]
+
+    def completed(self, key):
+        """
+        Check the completion of the read identified by `key` against its deadline.
+
+        :returns: whether the deadline was met, or `None` if the read had no deadline.
+        """
+        entry = self.deadlines.pop(key, None)
+        if entry is None:
+            return
+        priority, due = entry
+        met = perf_counter() <= due
+        if met:
+            self.met[priority] += 1
+        else:
+            self.missed[priority] += 1
+        return met
+
+
+class MemoryBudget:
+    """
+    A budget of bytes shared by a pool of workers and accounted per stage.
+
+    The bytes in use in each stage, their peaks and the time spent blocked
+    are kept in shared memory so every worker sees the whole pool's usage.
+    Bytes are admitted while the total stays within `limit`, or whenever
+    nothing is held so a single item larger than the budget still passes.
+
+    :param limit: the budget in bytes.
+    :param stages: the names of the stages bytes are accounted to.
+
+    >>> budget = MemoryBudget(100)
+    >>> budget.try_acquire('loaded', 60), budget.try_acquire('loaded', 60)
+    (True, False)
+    >>> budget.move('loaded', 'inflight', 60)
+    >>> budget.release('inflight', 60)
+    >>> budget.try_acquire('pending', 150)
+    True
+    >>> budget.usage(), budget.peaks()['total']
+    ({'loaded': 0, 'inflight': 0, 'pending': 150, 'total': 150}, 150)
+    """
+    def __init__(self, limit, stages=BUDGET_STAGES):
+        self.limit = int(limit)
+        self.stages = stages
+        # the current then peak bytes of each stage and the total, the waits and blocked ns
+        self.values = multiprocessing.RawArray('q', 2 * (len(stages) + 1) + 2)
+        self.lock = multiprocessing.Lock()
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, self.limit)
+
+    def _add(self, stage, nbytes):
+        index = self.stages.index(stage)
+        total = len(self.stages)
+        peak = total + 1
+        values = self.values
+        values[index] += nbytes
+        values[total] += nbytes
+        values[peak + index] = max(values[peak + index], values[index])
+        values[peak + total] = max(values[peak + total], values[total])
+
+    def try_acquire(self, stage, nbytes, force=False):
+        """
+        Account `nbytes` to `stage` if the budget has room for them, or always with `force`.
+
+        :returns: whether the bytes were admitted.
+        """
+        with self.lock:
+            used = self.values[len(self.stages)]
+            if not force and used and used + nbytes > self.limit:
+                return False
+            self._add(stage, nbytes)
+            return True
+
+    def acquire(self, stage, nbytes, snooze=1e-2):
+        """
+        Block until the budget has room for `nbytes` then account them to `stage`.
+        """
+        if self.try_acquire(stage, nbytes):
+            return
+        start = perf_counter()
+        while not self.try_acquire(stage, nbytes):
+            sleep(snooze)
+        with self.lock:
+            waits = 2 * (len(self.stages) + 1)
+            self.values[waits] += 1
+            self.values[waits + 1] += int((perf_counter() - start) * 1e9)
+
+    def release(self, stage, nbytes):
+        """
+        Return `nbytes` accounted to `stage`.
+        """
+        with self.lock:
+            self._add(stage, -nbytes)
+
+    def move(self, source, destination, nbytes):
+        """
+        Account `nbytes` held in `source` to `destination` instead, the total is unchanged.
+        """
+        with self.lock:
+            self._add(source, -nbytes)
+            self._add(destination, nbytes)
+
+    def usage(self):
+        """
+        The bytes currently held in each stage and in total.
+        """
+        return dict(zip(self.stages + ('total',), self.values[:len(self.stages) + 1]))
+
+    def peaks(self):
+        """
+        The most bytes held in each stage and in total at any one time.
+        """
+        count = len(self.stages) + 1
+        return dict(zip(self.stages + ('total',), self.values[count:2 * count]))
+
+    def blocked(self):
+        """
+        The number of times a worker blocked on the budget and the seconds spent blocked.
+        """
+        waits = 2 * (len(self.stages) + 1)
+        return self.values[waits], self.values[waits + 1] / 1e9
+
+    def format(self):
+        peaks = self.peaks()
+        waits, seconds = self.blocked()
+        lines = ["memory budget %s: peak %s, blocked %s times for %.3fs" % (
+            bases_fmt(self.limit, 'B'), bases_fmt(peaks['total'], 'B'), waits, seconds
+        )]
+        for stage in self.stages:
+            lines.append("  %-10s peak %s" % (stage, bases_fmt(peaks[stage], 'B')))
+        return "\n".join(lines)
+
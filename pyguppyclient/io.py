@@ -1,6 +1,11 @@
 import os
+import gzip
 import logging
+from time import perf_counter_ns
+from collections import OrderedDict, defaultdict
 from logging.handlers import RotatingFileHandler
+
+import numpy as np
 from ont_fast5_api.fast5_interface import get_fast5_file
 
 from pyguppyclient.decode import ReadData
@@ -8,28 +13,119 @@ from pyguppyclient.decode import ReadData
 logger = logging.getLogger("pyguppyclient")
 
 
-def yield_reads(filename):
+class ReadMetadata:
+    """
+    The metadata of a read that is available without loading its signal.
+
+    :param read_id: unique identifier for the `read`.
+    :param samples: the number of raw samples, from the shape of the signal dataset.
+    :param channel: the channel number.
+    :param start_time: the start of the read in samples since the start of the run.
+    :param sampling_rate: the number of samples per second.
+    """
+    def __init__(self, read_id, samples, channel, start_time, sampling_rate):
+        self.read_id = read_id
+        self.samples = samples
+        self.channel = channel
+        self.start_time = start_time
+        self.sampling_rate = sampling_rate
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, self.read_id)
+
+
+class ReadFilter:
+    """
+    A read metadata predicate for `yield_reads`, every given condition must hold.
+
+    :param min_samples: the fewest raw samples in a read.
+    :param max_samples: the most raw samples in a read.
+    :param channels: a collection of channel numbers to keep.
+    :param start: the earliest read start in seconds since the start of the run.
+    :param end: the latest read start in seconds since the start of the run.
+    :param read_ids: a collection of read ids to keep.
+
+    >>> keep = ReadFilter(min_samples=1000, channels={1, 2}, read_ids={'a', 'b'})
+    >>> keep(ReadMetadata('a', 4000, 2, 0, 4000.0)), keep(ReadMetadata('b', 500, 2, 0, 4000.0))
+    (True, False)
+    >>> ReadFilter(start=10)(ReadMetadata('c', 4000, 1, 20000, 4000.0))
+    False
+    """
+    def __init__(self, min_samples=None, max_samples=None, channels=None, start=None, end=None, read_ids=None):
+        self.min_samples = min_samples
+        self.max_samples = max_samples
+        self.channels = set(channels) if channels is not None else None
+        self.start = start
+        self.end = end
+        self.read_ids = set(read_ids) if read_ids is not None else None
+
+    def __repr__(self):
+        return "%s" % (self.__class__.__name__)
+
+    def __call__(self, meta):
+        if self.min_samples is not None and meta.samples < self.min_samples:
+            return False
+        if self.max_samples is not None and meta.samples > self.max_samples:
+            return False
+        if self.channels is not None and meta.channel not in self.channels:
+            return False
+        if self.read_ids is not None and meta.read_id not in self.read_ids:
+            return False
+        if self.start is not None or self.end is not None:
+            start = meta.start_time / meta.sampling_rate
+            if self.start is not None and start < self.start:
+                return False
+            if self.end is not None and start > self.end:
+                return False
+        return True
+
+
+def yield_reads(filename, read_filter=None):
     """
     Yield a `RawRead` object for every read in the .fast5 `filename`.
     :param filename: Path to a fast5 file
+    :param read_filter: an optional predicate of a `ReadMetadata`, the signal is only
+                        read for the reads it returns True for, e.g. a `ReadFilter`.
     :return: `ReadData` for every read in the input file `filename`
     """
     with get_fast5_file(filename, 'r') as f5_fh:
         for read in f5_fh.get_reads():
-            raw = read.handle[read.raw_dataset_name][:]
+            load = perf_counter_ns()
             channel_info = read.handle[read.global_key + 'channel_id'].attrs
+            attrs = read.handle[read.raw_dataset_group_name].attrs
+            channel = int(channel_info['channel_number'])
+            start_time = int(attrs['start_time'])
+            sampling_rate = float(channel_info['sampling_rate'])
+            if read_filter is not None:
+                meta = ReadMetadata(
+                    read.read_id, read.handle[read.raw_dataset_name].shape[0], channel, start_time, sampling_rate,
+                )
+                if not read_filter(meta):
+                    continue
+            raw = read.handle[read.raw_dataset_name][:]
             scaling = channel_info['range'] / channel_info['digitisation']
             offset = int(channel_info['offset'])
-            yield ReadData(raw, read.read_id, scaling=scaling, offset=offset)
+            tracking = read.handle.get(read.global_key + 'tracking_id')
+            run_id = tracking.attrs.get('run_id') if tracking is not None else None
+            read = ReadData(raw, read.read_id, scaling=scaling, offset=offset)
+            read.filename = os.path.basename(filename)
+            read.run_id = run_id.decode() if isinstance(run_id, bytes) else run_id
+            read.channel = channel
+            read.start_time = start_time
+            read.sampling_rate = sampling_rate
+            read.timestamps['load'] = load
+            read.timestamps['loaded'] = perf_counter_ns()
+            yield read
 
 
-def load_reads(filename):
+def load_reads(filename, read_filter=None):
     """
     List containing a `RawRead` for every read in the .fast `filename`.
     :param filename: Path to a fast5 file
+    :param read_filter: an optional predicate of a `ReadMetadata`, see `yield_reads`.
     :return: `ReadData` for every read in the input file `filename`
     """
-    return list(yield_reads(filename))
+    return list(yield_reads(filename, read_filter))
 
 
 def write_fasta(read_id, sequence, fd):
@@ -50,6 +146,578 @@ def write_fastq(read_id, sequence, qstring, fd):
     fd.write('%s\n' % qstring)
 
 
+class DemuxWriter:
+    """
+    A fastq sink writing each called read to the file of its barcode.
+
+    Reads are routed by `barcode['normalized_id']` and held in a buffer per
+    barcode that is written out in one call once it reaches `buffer_size`
+    bytes. At most `max_open` files are kept open, the least recently
+    written is closed to make room, so many barcodes never mean a file open
+    and close per read. A compressed barcode has each buffer written as a
+    gzip member, the concatenated members are a valid gzip file.
+
+    :param directory: the output directory, created if missing.
+    :param max_open: the most output files to keep open at once.
+    :param buffer_size: the bytes to buffer per barcode before writing them out.
+    :param compress: gzip the output, either True for every barcode or a
+                     collection of the barcodes to compress.
+    :param min_score: the lowest barcode score to assign a read to its barcode,
+                      either a number for every barcode or a dict by barcode.
+    :param unclassified: the output name of reads with no barcode or one under
+                         its `min_score`.
+    :param compresslevel: the gzip compression level.
+    :param lock: an optional lock held while writing, to share the files
+                 between processes.
+
+    >>> import tempfile
+    >>> directory = tempfile.mkdtemp()
+    >>> writer = DemuxWriter(directory, max_open=1, compress={'barcode02'}, min_score={'barcode01': 60})
+    >>> writer.write('a', 'ACGT', '####', {'normalized_id': 'barcode01', 'score': 70.0})
+    'barcode01'
+    >>> writer.write('b', 'ACGT', '####', {'normalized_id': 'barcode01', 'score': 50.0})
+    'unclassified'
+    >>> writer.write('c', 'ACGT', '####', {'normalized_id': 'barcode02', 'score': 50.0})
+    'barcode02'
+    >>> writer.close()
+    >>> sorted(os.listdir(directory))
+    ['barcode01.fastq', 'barcode02.fastq.gz', 'unclassified.fastq']
+    >>> gzip.open(os.path.join(directory, 'barcode02.fastq.gz'), 'rt').read().split()
+    ['@c', 'ACGT', '+', '####']
+    """
+    def __init__(self, directory, max_open=32, buffer_size=2**20, compress=False, min_score=None,
+                 unclassified='unclassified', compresslevel=1, lock=None):
+        self.directory = directory
+        self.max_open = max_open
+        self.buffer_size = buffer_size
+        self.compress = compress
+        self.min_score = min_score
+        self.unclassified = unclassified
+        self.compresslevel = compresslevel
+        self.lock = lock
+        self.counts = defaultdict(int)
+        self.buffers = defaultdict(list)
+        self.buffered = defaultdict(int)
+        self.handles = OrderedDict()
+        os.makedirs(directory, exist_ok=True)
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, self.directory)
+
+    def __getstate__(self):
+        # only the settings travel to other processes, not the files or buffers
+        state = self.__dict__.copy()
+        state['lock'] = None
+        state['counts'] = defaultdict(int)
+        state['buffers'] = defaultdict(list)
+        state['buffered'] = defaultdict(int)
+        state['handles'] = OrderedDict()
+        return state
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _compressed(self, barcode):
+        if isinstance(self.compress, bool):
+            return self.compress
+        return barcode in self.compress
+
+    def path(self, barcode):
+        """
+        The output filename of `barcode`.
+        """
+        name = "%s.fastq" % barcode
+        if self._compressed(barcode):
+            name += ".gz"
+        return os.path.join(self.directory, name)
+
+    def assign(self, barcode):
+        """
+        The output name of a read with the `barcode` dict of a `CalledReadData`.
+        """
+        if not barcode or not barcode.get('normalized_id'):
+            return self.unclassified
+        name = barcode['normalized_id']
+        threshold = self.min_score.get(name) if isinstance(self.min_score, dict) else self.min_score
+        if threshold is not None and (barcode.get('score') or 0) < threshold:
+            return self.unclassified
+        return name
+
+    def write(self, read_id, sequence, qstring, barcode=None):
+        """
+        Buffer a fastq record for its barcode, writing the buffer out once full.
+
+        :returns: the output name the read was assigned to.
+        """
+        name = self.assign(barcode)
+        record = "@%s\n%s\n+\n%s\n" % (read_id, sequence, qstring)
+        self.buffers[name].append(record)
+        self.buffered[name] += len(record)
+        self.counts[name] += 1
+        if self.buffered[name] >= self.buffer_size:
+            self.flush(name)
+        return name
+
+    def write_called(self, read_id, called):
+        """
+        Buffer a `CalledReadData` for its barcode.
+        """
+        return self.write(read_id, called.seq, called.qual, called.barcode)
+
+    def _handle(self, name):
+        """
+        The open file of `name`, closing the least recently used beyond `max_open`.
+        """
+        if name in self.handles:
+            self.handles.move_to_end(name)
+            return self.handles[name]
+        while len(self.handles) >= self.max_open:
+            self.handles.popitem(last=False)[1].close()
+        handle = self.handles[name] = open(self.path(name), 'ab')
+        return handle
+
+    def flush(self, name=None):
+        """
+        Write out the buffer of `name`, or of every barcode.
+        """
+        names = list(self.buffers) if name is None else [name]
+        for name in names:
+            records = self.buffers.pop(name, None)
+            self.buffered.pop(name, None)
+            if not records:
+                continue
+            data = "".join(records).encode()
+            if self._compressed(name):
+                data = gzip.compress(data, compresslevel=self.compresslevel)
+            handle = self._handle(name)
+            if self.lock is None:
+                handle.write(data)
+                handle.flush()
+            else:
+                with self.lock:
+                    handle.write(data)
+                    handle.flush()
+
+    def close(self):
+        """
+        Write out every buffer and close the files.
+        """
+        self.flush()
+        while self.handles:
+            self.handles.popitem()[1].close()
+
+
+# the sequencing summary columns and their dtype, `None` for strings
+SUMMARY_COLUMNS = (
+    ('filename', None),
+    ('read_id', None),
+    ('run_id', None),
+    ('channel', np.int64),
+    ('start_time', np.float64),
+    ('duration', np.float64),
+    ('trimmed_samples', np.int64),
+    ('sequence_length_template', np.int64),
+    ('mean_qscore_template', np.float32),
+    ('median_template', np.float32),
+    ('mad_template', np.float32),
+    ('pt_median', np.float32),
+    ('pt_sd', np.float32),
+    ('barcode_arrangement', None),
+    ('barcode_full_arrangement', None),
+    ('barcode_kit', None),
+    ('barcode_variant', None),
+    ('barcode_score', np.float32),
+)
+
+
+class SummaryWriter:
+    """
+    A sequencing summary sink collecting called read metadata in columns.
+
+    Each read fills a row of preallocated numpy column buffers, once
+    `chunk` rows are held they are formatted a column at a time and written
+    out together, so nothing is formatted per read and a lock shared with
+    other processes is only held for the write. Missing scaling and barcode
+    numbers, start times and durations are NaN, a missing channel is 0 and
+    missing strings are empty. `start_time` and `duration` are in seconds,
+    `trimmed_samples` is the samples trimmed from the start of the read.
+
+    The `tsv` format uses the `sequencing_summary.txt` column names for the
+    columns above, its header is written when the writer is created. The `parquet` format needs pyarrow
+    and `filename` is then a directory with a part file per process.
+
+    :param filename: the output file, or directory for `parquet`.
+    :param chunk: the rows to buffer before writing them out.
+    :param format: `tsv` or `parquet`.
+    :param lock: an optional lock held while writing, to share the file between processes.
+
+    >>> import tempfile
+    >>> filename = os.path.join(tempfile.mkdtemp(), 'sequencing_summary.txt')
+    >>> writer = SummaryWriter(filename, chunk=2)
+    >>> for read_id in 'abc':
+    ...     writer.add(read_id, 1.0, 100, 450, 11.5, filename='batch0.fast5', run_id='run0', channel=7,
+    ...                start_time=12.25, scaling={'median': 80.5, 'med_abs_dev': 10.0},
+    ...                barcode={'normalized_id': 'barcode01'})
+    >>> writer.close()
+    >>> lines = open(filename).read().splitlines()
+    >>> len(lines), lines[0].split('\\t')[:7]
+    (4, ['filename', 'read_id', 'run_id', 'channel', 'start_time', 'duration', 'trimmed_samples'])
+    >>> lines[3].split('\\t')[:11], lines[3].split('\\t')[-5]
+    (['batch0.fast5', 'c', 'run0', '7', '12.250000', '1.000000', '100', '450', '11.5', '80.5', '10'], 'barcode01')
+    """
+    formats = ('tsv', 'parquet')
+
+    def __init__(self, filename, chunk=10000, format='tsv', lock=None):
+        if format not in self.formats:
+            raise ValueError("unknown summary format %r, expected one of %s" % (format, ", ".join(self.formats)))
+        self.filename = filename
+        self.chunk = chunk
+        self.format = format
+        self.lock = lock
+        self.rows = 0
+        self.written = 0
+        self.columns = None
+        self.parquet = None
+        if format == 'tsv':
+            with open(filename, 'w') as fd:
+                fd.write("\t".join(name for name, _ in SUMMARY_COLUMNS) + "\n")
+        else:
+            os.makedirs(filename, exist_ok=True)
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, self.filename)
+
+    def __getstate__(self):
+        # only the settings travel to other processes, not the buffered rows
+        state = self.__dict__.copy()
+        state['lock'] = None
+        state['rows'] = 0
+        state['written'] = 0
+        state['columns'] = None
+        state['parquet'] = None
+        return state
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _allocate(self):
+        self.columns = {
+            name: np.empty(self.chunk, dtype=object) if dtype is None else np.empty(self.chunk, dtype=dtype)
+            for name, dtype in SUMMARY_COLUMNS
+        }
+
+    def add(self, read_id, duration, trimmed_samples, sequence_length, qscore,
+            filename=None, scaling=None, barcode=None, run_id=None, channel=None, start_time=None):
+        """
+        Buffer the summary row of a read.
+
+        :param duration: the length of the read in seconds.
+        :param trimmed_samples: the samples trimmed from the start of the read.
+        :param scaling: the `scaling` dict of a `CalledReadData`.
+        :param barcode: the `barcode` dict of a `CalledReadData`.
+        :param start_time: the start of the read in seconds since the start of the run.
+        """
+        if self.columns is None:
+            self._allocate()
+        scaling = scaling or {}
+        barcode = barcode or {}
+        row = self.rows
+        columns = self.columns
+        columns['filename'][row] = filename or ''
+        columns['read_id'][row] = read_id
+        columns['run_id'][row] = run_id or ''
+        columns['channel'][row] = channel or 0
+        columns['start_time'][row] = _number(start_time)
+        columns['duration'][row] = _number(duration)
+        columns['trimmed_samples'][row] = trimmed_samples
+        columns['sequence_length_template'][row] = sequence_length
+        columns['mean_qscore_template'][row] = qscore
+        columns['median_template'][row] = _number(scaling.get('median'))
+        columns['mad_template'][row] = _number(scaling.get('med_abs_dev'))
+        columns['pt_median'][row] = _number(scaling.get('pt_median'))
+        columns['pt_sd'][row] = _number(scaling.get('ptsd'))
+        columns['barcode_arrangement'][row] = barcode.get('normalized_id') or ''
+        columns['barcode_full_arrangement'][row] = barcode.get('id') or ''
+        columns['barcode_kit'][row] = barcode.get('kit') or ''
+        columns['barcode_variant'][row] = barcode.get('variant') or ''
+        columns['barcode_score'][row] = _number(barcode.get('score'))
+        self.rows += 1
+        if self.rows == self.chunk:
+            self.flush()
+
+    def add_called(self, read, called, sent=None):
+        """
+        Buffer the summary row of a `pyguppy_client_lib` layout `read` dict and its `CalledReadData`.
+
+        :param sent: the `ReadData` that was basecalled, for the file, run, channel and
+                     the sampling rate to convert the duration and start time to seconds.
+        """
+        metadata = read['metadata']
+        duration = start_time = None
+        if sent is not None and sent.sampling_rate:
+            duration = metadata['duration'] / sent.sampling_rate
+            if sent.start_time is not None:
+                start_time = sent.start_time / sent.sampling_rate
+        self.add(
+            metadata['read_id'], duration, metadata['trimmed_samples'], called.seqlen, called.qscore,
+            sent.filename if sent is not None else None, called.scaling, called.barcode,
+            sent.run_id if sent is not None else None, sent.channel if sent is not None else None, start_time,
+        )
+
+    def _tsv(self, columns):
+        formatted = []
+        for name, dtype in SUMMARY_COLUMNS:
+            values = columns[name]
+            if dtype is None or np.issubdtype(dtype, np.integer):
+                formatted.append(values.astype(str))
+            elif dtype is np.float64:
+                # times to the microsecond, well within a sample
+                formatted.append(np.char.mod('%.6f', values))
+            else:
+                formatted.append(np.char.mod('%g', values))
+        rows = formatted[0]
+        for column in formatted[1:]:
+            rows = np.char.add(np.char.add(rows, '\t'), column)
+        return ("\n".join(rows.tolist()) + "\n").encode()
+
+    def _parquet(self, columns):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("the parquet summary format needs pyarrow") from None
+        table = pa.table({
+            name: pa.array(columns[name].tolist() if dtype is None else columns[name])
+            for name, dtype in SUMMARY_COLUMNS
+        })
+        if self.parquet is None:
+            part = os.path.join(self.filename, "part-%s.parquet" % os.getpid())
+            self.parquet = pq.ParquetWriter(part, table.schema)
+        self.parquet.write_table(table)
+
+    def flush(self):
+        """
+        Write out the buffered rows.
+        """
+        if not self.rows:
+            return
+        columns = {name: values[:self.rows] for name, values in self.columns.items()}
+        if self.format == 'parquet':
+            # each process writes its own part file, no lock needed
+            self._parquet(columns)
+        else:
+            data = self._tsv(columns)
+            if self.lock is None:
+                _append(self.filename, data)
+            else:
+                with self.lock:
+                    _append(self.filename, data)
+        self.written += self.rows
+        self.rows = 0
+
+    def close(self):
+        """
+        Write out the buffered rows and close the output.
+        """
+        self.flush()
+        if self.parquet is not None:
+            self.parquet.close()
+            self.parquet = None
+
+
+def _number(value):
+    return np.nan if value is None else value
+
+
+def _append(filename, data):
+    with open(filename, 'ab') as fd:
+        fd.write(data)
+
+
+def _write_all(fd, data):
+    """
+    Write all the bytes of `data` to the unbuffered `fd`, whose writes may be short.
+    """
+    view = memoryview(data)
+    while view:
+        view = view[fd.write(view):]
+
+
+# the index record of a read in a `StateStore`
+STATE_INDEX = np.dtype([
+    ('read_id', 'S64'),
+    ('offset', '<i8'),
+    ('rows', '<i8'),
+    ('columns', '<i4'),
+    ('dtype', 'S8'),
+    ('low', '<f4'),
+    ('scale', '<f4'),
+])
+
+
+class StateHandle:
+    """
+    The location of a read's `state` posteriors in a `StateStore`.
+
+    :param filename: the store data file.
+    :param offset: the byte offset of the posteriors in `filename`.
+    :param shape: the events and state size of the posteriors.
+    :param dtype: the stored dtype, `float32`, `float16` or `uint8`.
+    :param low: the value of a zero uint8.
+    :param scale: the value of a uint8 step.
+    """
+    def __init__(self, filename, offset, shape, dtype, low=0.0, scale=1.0):
+        self.filename = filename
+        self.offset = offset
+        self.shape = shape
+        self.dtype = np.dtype(dtype)
+        self.low = low
+        self.scale = scale
+
+    def __repr__(self):
+        return "%s(%s, %s)" % (self.__class__.__name__, self.filename, self.offset)
+
+    def load(self):
+        """
+        The posteriors memory mapped from the store, float32 stores are returned
+        as the read only map itself and quantised stores as a float32 copy.
+        """
+        if not self.shape[0]:
+            return np.zeros(self.shape, dtype=np.float32)
+        data = np.memmap(self.filename, dtype=self.dtype, mode='r', offset=self.offset, shape=self.shape)
+        if self.dtype == np.uint8:
+            return data * np.float32(self.scale) + np.float32(self.low)
+        if self.dtype == np.float16:
+            return data.astype(np.float32)
+        return data
+
+
+class StateStore:
+    """
+    An append only store of the `state` posteriors of called reads.
+
+    Each posterior is written straight to the end of a data file and its
+    location to a fixed width binary index beside it, nothing is kept in
+    memory so the footprint doesn't grow with the reads written. Every
+    process appends to its own `state-<pid>.bin` and `state-<pid>.index`
+    in `directory`, `open_states` maps them back.
+
+    Posteriors are optionally quantised to `float16` or to `uint8` steps
+    between the smallest and largest value of each read.
+
+    :param directory: the output directory, created if missing.
+    :param dtype: the stored dtype, `float32`, `float16` or `uint8`.
+
+    >>> import tempfile
+    >>> directory = tempfile.mkdtemp()
+    >>> state = np.linspace(-4.0, 4.0, 12, dtype=np.float32).reshape(3, 4)
+    >>> with StateStore(directory, dtype='uint8') as store:
+    ...     handle = store.write('a', state)
+    ...     empty = store.write('b', np.zeros((0, 4), dtype=np.float32))
+    >>> handle.shape, float(np.abs(handle.load() - state).max()) < 8.0 / 255
+    ((3, 4), True)
+    >>> states = open_states(directory)
+    >>> sorted(states), states['a'].offset, states['b'].load().shape
+    (['a', 'b'], 0, (0, 4))
+    """
+    dtypes = ('float32', 'float16', 'uint8')
+
+    def __init__(self, directory, dtype='float16'):
+        if dtype not in self.dtypes:
+            raise ValueError("unknown state dtype %r, expected one of %s" % (dtype, ", ".join(self.dtypes)))
+        self.directory = directory
+        self.dtype = np.dtype(dtype)
+        self.data = None
+        self.index = None
+        self.offset = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, self.directory)
+
+    def __getstate__(self):
+        # the files are per process and opened on first write
+        state = self.__dict__.copy()
+        state['data'] = None
+        state['index'] = None
+        state['offset'] = 0
+        return state
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _open(self):
+        name = os.path.join(self.directory, "state-%s" % os.getpid())
+        # unbuffered so a handle can be loaded as soon as it is returned
+        self.data = open(name + ".bin", 'ab', buffering=0)
+        self.index = open(name + ".index", 'ab', buffering=0)
+        self.offset = self.data.tell()
+
+    def write(self, read_id, state):
+        """
+        Append the `state` posteriors of a read.
+
+        :returns: the `StateHandle` to load them back.
+        """
+        if self.data is None:
+            self._open()
+        state = np.asarray(state)
+        if state.ndim == 1:
+            state = state.reshape(-1, 1)
+        low, scale = 0.0, 1.0
+        if self.dtype == np.uint8 and state.size:
+            low = float(state.min())
+            scale = float(state.max() - low) / 255 or 1.0
+            stored = np.rint((state - low) / scale).astype(np.uint8)
+        else:
+            stored = state.astype(self.dtype, copy=False)
+        stored = np.ascontiguousarray(stored)
+        _write_all(self.data, stored.reshape(-1).view(np.uint8))
+        handle = StateHandle(self.data.name, self.offset, state.shape, self.dtype, low, scale)
+        record = np.array(
+            [(read_id.encode(), self.offset, state.shape[0], state.shape[1], self.dtype.name.encode(), low, scale)],
+            dtype=STATE_INDEX,
+        )
+        _write_all(self.index, record.tobytes())
+        self.offset += stored.nbytes
+        return handle
+
+    def close(self):
+        """
+        Close the files of this process.
+        """
+        for fd in (self.data, self.index):
+            if fd is not None:
+                fd.close()
+        self.data = self.index = None
+
+
+def open_states(directory):
+    """
+    The `StateHandle` of every read in the `StateStore` at `directory` by read id.
+    """
+    handles = dict()
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".index"):
+            continue
+        data = os.path.join(directory, name[:-len(".index")] + ".bin")
+        for record in np.fromfile(os.path.join(directory, name), dtype=STATE_INDEX):
+            handles[record['read_id'].decode()] = StateHandle(
+                data, int(record['offset']), (int(record['rows']), int(record['columns'])),
+                record['dtype'].decode(), float(record['low']), float(record['scale']),
+            )
+    return handles
+
+
 def setup_logger(logdir, filename, level=logging.INFO):
     """
     Setup a logger
@@ -1,8 +1,7 @@
 import os
 
-from flatbuffers import Builder
-
-from pyguppyclient.decode import PROTO_VERSION, set_file_identifier
+from pyguppyclient.decode import PROTO_VERSION, called_read_block
+from pyguppyclient.codec import constant_request, encode_simple, decode_header, decode_simple
 
 from pyguppyclient.guppy_ipc.Content import Content
 import pyguppyclient.guppy_ipc.MessageData as MessageData
@@ -11,10 +10,11 @@ import pyguppyclient.guppy_ipc.ServerStats as ServerStats
 import pyguppyclient.guppy_ipc.SimpleReplyData as SimpleReplyData
 import pyguppyclient.guppy_ipc.SimpleRequestData as SimpleRequestData
 import pyguppyclient.guppy_ipc.ConfigData as ConfigData
+import pyguppyclient.guppy_ipc.ReadBlockData as ReadBlockData
 
+from pyguppyclient.guppy_ipc.ReadBlockType import ReadBlockType
 from pyguppyclient.guppy_ipc.SimpleReplyType import SimpleReplyType
 from pyguppyclient.guppy_ipc.SimpleRequestType import SimpleRequestType
-from pyguppyclient.guppy_ipc.ProtocolVersion import CreateProtocolVersion
 
 
 def lookup(c):
@@ -24,120 +24,124 @@ def lookup(c):
 replylookup = lookup(SimpleReplyType)
 requestlookup = lookup(SimpleRequestType)
 contentlookup = lookup(Content)
+blocklookup = lookup(ReadBlockType)
+
+# read once, set `pyguppyclient.ipc.DEBUG_TRANSPORT` to change it at runtime
+DEBUG_TRANSPORT = bool(os.environ.get("DEBUG_TRANSPORT"))
 
 
 def simple_request(request_type, client_id=0, text=None, data=None):
+    """
+    Encode a `SimpleRequestData` message, requests without text or data come from a cache.
+    """
+    if text is None and data is None:
+        buff = constant_request(request_type, client_id)
+    else:
+        buff = encode_simple(request_type, client_id, text, data)
 
-    builder = Builder(50)
+    if DEBUG_TRANSPORT:
+        print('->', "SimpleRequestData", "%-23s" % requestlookup[request_type], data, text, sep='\t')
 
-    if text is not None:
-        text = builder.CreateString(text)
+    return buff
 
-    # Create Simple Request Data
-    SimpleRequestData.SimpleRequestDataStart(builder)
-    SimpleRequestData.SimpleRequestDataAddType(
-        builder,
-        request_type
-    )
 
-    if text is not None:
-        SimpleRequestData.SimpleRequestDataAddText(
-            builder,
-            text
-        )
-
-    if data is not None:
-        SimpleRequestData.SimpleRequestDataAddData(
-            builder,
-            data,
-        )
+def simple_response(buff):
+    major, _, content_type, pos = decode_header(buff)
 
-    contentOffset = SimpleRequestData.SimpleRequestDataEnd(builder)
+    if major != PROTO_VERSION[0]:
+        raise Exception("Server IPC major version {} does not match "
+                        "pyguppyclient IPC major version {} -- cannot decode "
+                        "message.".format(major, PROTO_VERSION[0]))
 
-    # Create Message Data
-    MessageData.MessageDataStart(builder)
+    if content_type == Content.SimpleReplyData:
+        reply, data, text = decode_simple(buff, pos)
+        if DEBUG_TRANSPORT:
+            print('<-', "SimpleReplyData  ", "%-23s" % replylookup[reply], data, text, sep='\t')
 
-    MessageData.MessageDataAddVersion(
-        builder,
-        CreateProtocolVersion(builder, *PROTO_VERSION)
-    )
+        if reply == SimpleReplyType.NONE_PENDING:
+            return
+        if reply == SimpleReplyType.INVALID_CONFIG:
+            raise ValueError("Invalid Config")
+        if reply == SimpleReplyType.BAD_REQUEST:
+            raise Exception("Bad request:", text)
+        if reply == SimpleReplyType.BAD_REPLY:
+            raise Exception(text.decode())
 
-    MessageData.MessageDataAddSenderId(
-        builder,
-        client_id
-    )
+        cls = SimpleReplyData.SimpleReplyData()
+        cls.Init(buff, pos)
 
-    MessageData.MessageDataAddContentType(
-        builder,
-        Content.SimpleRequestData
-    )
+    elif content_type == Content.SimpleRequestData:
+        cls = SimpleRequestData.SimpleRequestData()
+        cls.Init(buff, pos)
+        if DEBUG_TRANSPORT:
+            print('<-', "SimpleRequestData", "%-23s" % requestlookup[cls.Type()], cls.Data(), cls.Text(), sep='\t')
 
-    MessageData.MessageDataAddContent(
-        builder,
-        contentOffset
-    )
+    elif content_type == Content.ConfigData:
+        cls = ConfigData.ConfigData()
+        cls.Init(buff, pos)
+        if DEBUG_TRANSPORT:
+            print('<-', "ConfigData", "\tCONFIG", sep="\t")
 
-    end = MessageData.MessageDataEnd(builder)
-    builder.Finish(end)
+    elif content_type == Content.ServerStats:
+        cls = ServerStats.ServerStats()
+        cls.Init(buff, pos)
+        if DEBUG_TRANSPORT:
+            print('<-', "ServerStats", "\tSTATS", sep="\t")
+
+    elif content_type == Content.ReadBlockData:
+        cls = called_read_block(MessageData.MessageData.GetRootAsMessageData(buff, 0))
+        if DEBUG_TRANSPORT:
+            print('<-', "ReadBlockData", "\tPASS_READ", sep="\t")
+    else:
+        raise Exception("Unhandled Response %s" % content_type)
 
-    if os.environ.get("DEBUG_TRANSPORT"):
-        print('->', "SimpleRequestData", "%-23s" % requestlookup[request_type], data, text, sep='\t')
+    return cls
 
-    return set_file_identifier(builder.Output())
 
+def describe(buff):
+    """
+    Decode the header of any message for monitoring, never raising on error replies.
 
-def simple_response(buff):
+    :returns: a dict with the `content` type, `sender` id, message `type`, the
+              simple message `data` and `text`, and the read details of
+              `ReadBlockData` messages.
+    """
     req = MessageData.MessageData.GetRootAsMessageData(buff, 0)
+    content = req.ContentType()
+    info = {
+        'content': contentlookup.get(content, content),
+        'sender': req.SenderId(),
+        'size': len(buff),
+        'type': None,
+    }
+
+    if content == Content.SimpleRequestData:
+        cls = SimpleRequestData.SimpleRequestData()
+        cls.Init(req.Content().Bytes, req.Content().Pos)
+        info.update(type=requestlookup.get(cls.Type(), cls.Type()), data=cls.Data(), text=cls.Text())
 
-    if req.Version().MajorVersion() != PROTO_VERSION[0]:
-        raise Exception("Server IPC major version {} does not match "
-                        "pyguppyclient IPC major version {} -- cannot decode "
-                        "message.".format(req.Version().MajorVersion(),
-                                          PROTO_VERSION[0]))
-
-    if req.ContentType() == Content.SimpleReplyData:
+    elif content == Content.SimpleReplyData:
         cls = SimpleReplyData.SimpleReplyData()
         cls.Init(req.Content().Bytes, req.Content().Pos)
-        name = replylookup[cls.Type()]
-        if os.environ.get("DEBUG_TRANSPORT"):
-            print('<-', "SimpleReplyData  ", "%-23s" % name, cls.Data(), cls.Text(), sep='\t')
-
-        if cls.Type() == SimpleReplyType.INVALID_CONFIG:
-            raise ValueError("Invalid Config")
-        if cls.Type() == SimpleReplyType.BAD_REQUEST:
-            raise Exception("Bad request:", cls.Text())
-        if cls.Type() == SimpleReplyType.BAD_REPLY:
-            raise Exception(cls.Text().decode())
-        if cls.Type() == SimpleReplyType.NONE_PENDING:
-            return
+        info.update(type=replylookup.get(cls.Type(), cls.Type()), data=cls.Data(), text=cls.Text())
 
-    elif req.ContentType() == Content.SimpleRequestData:
-        cls = SimpleRequestData.SimpleRequestData()
+    elif content == Content.ReadBlockData:
+        cls = ReadBlockData.ReadBlockData()
         cls.Init(req.Content().Bytes, req.Content().Pos)
-        name = requestlookup[cls.Type()]
-        if os.environ.get("DEBUG_TRANSPORT"):
-            print('<-', "SimpleRequestData", "%-23s" % name, cls.Data(), cls.Text(), sep='\t')
+        read_id = cls.ReadId()
+        info.update(
+            type=blocklookup.get(cls.Type(), cls.Type()),
+            read_id=read_id.decode() if read_id is not None else None,
+            read_tag=cls.ReadTag(),
+            block_index=cls.BlockIndex(),
+            total_blocks=cls.TotalBlocks(),
+            samples=cls.RawDataLength(),
+        )
 
-    elif req.ContentType() == Content.ConfigData:
-        cls = ConfigData.ConfigData()
-        cls.Init(req.Content().Bytes, req.Content().Pos)
-        name = "ConfigData"
-        if os.environ.get("DEBUG_TRANSPORT"):
-            print('<-', name, "\tCONFIG", sep="\t")
+    elif content == Content.ConfigData:
+        info['type'] = 'CONFIGS'
 
-    elif req.ContentType() == Content.ServerStats:
-        cls = ServerStats.ServerStats()
-        cls.Init(req.Content().Bytes, req.Content().Pos)
-        name = "ServerStats"
-        if os.environ.get("DEBUG_TRANSPORT"):
-            print('<-', name, "\tSTATS", sep="\t")
-
-    elif req.ContentType() == Content.ReadBlockData:
-        cls = called_read_block(req)
-        name = "ReadBlockData"
-        if os.environ.get("DEBUG_TRANSPORT"):
-            print('<-', name, "\tPASS_READ", sep="\t")
-    else:
-        raise Exception("Unhandled Response %s" % req.ContentType())
+    elif content == Content.ServerStats:
+        info['type'] = 'STATISTICS'
 
-    return cls
+    return info
@@ -0,0 +1,365 @@
+"""
+pyguppyclient metrics
+"""
+
+import os
+import resource
+import multiprocessing
+
+import numpy as np
+
+
+STAGES = ('load', 'wait', 'server', 'decode', 'callback', 'total')
+COUNTERS = ('reads_submitted', 'reads_completed', 'samples_submitted', 'samples_completed', 'rss_bytes')
+
+
+class Histogram:
+    """
+    HDR style log-linear histogram of non-negative integer values.
+
+    Values below `2 ** bits` are counted exactly, above that each power of
+    two is split into `2 ** (bits - 1)` buckets, keeping the relative error
+    of any reported value within `2 ** (1 - bits)`. Recording a value is a
+    handful of integer operations and histograms with the same layout are
+    merged by adding their counts.
+
+    :param bits: the number of significant bits per bucket.
+    :param maximum: the largest value that can be recorded, larger values are clamped.
+    :param buffer: an optional int64 buffer of `size + 1` elements to hold the bucket
+                   counts followed by the sum of the values, e.g. shared memory.
+
+    >>> h = Histogram()
+    >>> for value in range(1, 1001): h.record(value)
+    >>> h.count, h.min, h.max
+    (1000, 1, 1000)
+    >>> h.percentile(50), h.percentile(99)
+    (500, 984)
+    """
+    def __init__(self, bits=7, maximum=2**40, buffer=None):
+        self.bits = bits
+        self.half = 1 << (bits - 1)
+        self.limit = 1 << bits
+        self.maximum = maximum
+        self.size = self.index(maximum) + 1
+        if buffer is None:
+            buffer = np.zeros(self.size + 1, dtype=np.int64)
+        self.buffer = np.frombuffer(buffer, dtype=np.int64, count=self.size + 1)
+        self.counts = self.buffer[:self.size]
+        # indexing a memoryview is several times cheaper than a numpy scalar
+        self._view = memoryview(self.buffer)
+        self.min = None
+        self.max = None
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, self.count)
+
+    def __iadd__(self, other):
+        return self.merge(other)
+
+    @staticmethod
+    def nbytes(bits=7, maximum=2**40):
+        """
+        The size in bytes of the buffer backing a histogram.
+
+        >>> Histogram.nbytes() == Histogram().buffer.nbytes
+        True
+        """
+        shift = max(maximum.bit_length() - bits, 0)
+        size = shift * (1 << (bits - 1)) + (maximum >> shift) + 1
+        return (size + 1) * 8
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['buffer'] = self.buffer.copy()
+        del state['counts'], state['_view']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.counts = self.buffer[:self.size]
+        self._view = memoryview(self.buffer)
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    @property
+    def total(self):
+        return self._view[self.size]
+
+    @total.setter
+    def total(self, value):
+        self._view[self.size] = value
+
+    def index(self, value):
+        """
+        The bucket index of `value`.
+        """
+        if value < self.limit:
+            return value
+        shift = value.bit_length() - self.bits
+        return shift * self.half + (value >> shift)
+
+    def value(self, index):
+        """
+        The lowest value counted in bucket `index`.
+        """
+        if index < self.limit:
+            return index
+        shift = index // self.half - 1
+        return (index - shift * self.half) << shift
+
+    def record(self, value):
+        """
+        Count a single integer `value`.
+        """
+        value = min(int(value), self.maximum)
+        self._view[self.index(value)] += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def record_many(self, values):
+        """
+        Count an array of integer `values`.
+        """
+        values = np.minimum(np.asarray(values, dtype=np.int64), self.maximum)
+        if values.size == 0:
+            return
+        shift = np.maximum(np.floor(np.log2(np.maximum(values, 1))).astype(np.int64) + 1 - self.bits, 0)
+        index = np.where(values < self.limit, values, shift * self.half + (values >> shift))
+        np.add.at(self.counts, index, 1)
+        self.total += int(values.sum())
+        low, high = int(values.min()), int(values.max())
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+
+    def merge(self, other):
+        """
+        Add the counts of `other`, which must share the same layout.
+        """
+        self.buffer += other.buffer
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        if other.max is not None:
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        return self
+
+    def reset(self):
+        self.buffer[:] = 0
+        self.min = None
+        self.max = None
+
+    def mean(self):
+        count = self.count
+        return self.total / count if count else 0.0
+
+    def percentile(self, q):
+        """
+        The value below which `q` percent of the recorded values fall.
+        """
+        count = self.count
+        if count == 0:
+            return 0
+        rank = max(int(np.ceil(q / 100 * count)), 1)
+        index = int(np.searchsorted(np.cumsum(self.counts), rank))
+        value = self.value(index)
+        if self.max is not None:
+            value = min(value, self.max)
+        return value
+
+    def cumulative(self, bounds):
+        """
+        The number of values at or below each of the ascending `bounds`.
+        """
+        cumsum = np.cumsum(self.counts)
+        return [int(cumsum[self.index(min(int(bound), self.maximum))]) for bound in bounds]
+
+
+class LatencyRecorder:
+    """
+    Per stage latency histograms of the read lifecycle in nanoseconds.
+
+    The stages are the intervals between the timestamps of a read being
+    loaded from the fast5, passed to the server, seen in the completed
+    reads, decoded and handed to the callback.
+
+    :param stages: the names of the stages to record.
+    :param buffer: an optional int64 buffer to hold the histograms of every stage.
+    """
+    def __init__(self, stages=STAGES, buffer=None):
+        self.histograms = dict()
+        offset = 0
+        for stage in stages:
+            if buffer is None:
+                self.histograms[stage] = Histogram()
+            else:
+                size = Histogram.nbytes()
+                self.histograms[stage] = Histogram(buffer=memoryview(buffer).cast('B')[offset:offset + size])
+                offset += size
+
+    def __repr__(self):
+        return "%s" % (self.__class__.__name__)
+
+    def __iadd__(self, other):
+        return self.merge(other)
+
+    def __getitem__(self, stage):
+        return self.histograms[stage]
+
+    def record(self, stage, ns):
+        self.histograms[stage].record(ns)
+
+    def record_read(self, timestamps):
+        """
+        Record every stage of a read from its `perf_counter_ns` timestamps.
+        """
+        load = timestamps.get('load')
+        loaded = timestamps.get('loaded')
+        submitted = timestamps.get('submitted')
+        completed = timestamps.get('completed')
+        decoded = timestamps.get('decoded')
+        done = timestamps.get('done')
+        for stage, start, end in (
+                ('load', load, loaded),
+                ('wait', loaded, submitted),
+                ('server', submitted, completed),
+                ('decode', completed, decoded),
+                ('callback', decoded, done),
+                ('total', load, done),
+        ):
+            if start is not None and end is not None and stage in self.histograms:
+                self.histograms[stage].record(max(end - start, 0))
+
+    def merge(self, other):
+        for stage, histogram in other.histograms.items():
+            if stage in self.histograms:
+                self.histograms[stage].merge(histogram)
+        return self
+
+    def reset(self):
+        for histogram in self.histograms.values():
+            histogram.reset()
+
+    def report(self, percentiles=(50, 95, 99)):
+        """
+        The count, mean and `percentiles` of every stage in milliseconds.
+        """
+        return {
+            stage: dict(
+                count=histogram.count,
+                mean=histogram.mean() / 1e6,
+                **{'p%s' % q: histogram.percentile(q) / 1e6 for q in percentiles}
+            )
+            for stage, histogram in self.histograms.items()
+        }
+
+    def format(self, percentiles=(50, 95, 99)):
+        """
+        The report as a table suitable for printing.
+        """
+        columns = ['count', 'mean'] + ['p%s' % q for q in percentiles]
+        lines = ["%-10s" % "stage (ms)" + "".join("%12s" % c for c in columns)]
+        for stage, summary in self.report(percentiles).items():
+            lines.append("%-10s" % stage + "%12d" % summary['count'] + "".join(
+                "%12.3f" % summary[c] for c in columns[1:]
+            ))
+        return "\n".join(lines)
+
+
+class SharedMetrics:
+    """
+    Counters and latency histograms of a pool of workers in shared memory.
+
+    Every worker claims its own slot with `attach` and updates it without
+    locking or any IPC, the parent sums the slots whenever it needs them.
+
+    :param workers: the number of worker slots.
+    :param stages: the names of the latency stages to record.
+    """
+    def __init__(self, workers, stages=STAGES):
+        self.workers = workers
+        self.stages = stages
+        self.counter_bytes = len(COUNTERS) * 8
+        self.slot_bytes = self.counter_bytes + len(stages) * Histogram.nbytes()
+        self.buffer = multiprocessing.RawArray('b', workers * self.slot_bytes)
+        self.next_slot = multiprocessing.Value('i', 0)
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, self.workers)
+
+    def slot(self, index):
+        """
+        The `WorkerMetrics` view of slot `index`.
+        """
+        start = index * self.slot_bytes
+        return WorkerMetrics(
+            memoryview(self.buffer).cast('B')[start:start + self.slot_bytes], self.counter_bytes, self.stages
+        )
+
+    def attach(self):
+        """
+        Claim the next free slot for the calling worker process.
+        """
+        with self.next_slot.get_lock():
+            index = self.next_slot.value % self.workers
+            self.next_slot.value += 1
+        return self.slot(index)
+
+    def counters(self):
+        """
+        The counters of every worker as a list of dicts.
+        """
+        return [self.slot(index).counters() for index in range(self.workers)]
+
+    def latency(self):
+        """
+        A `LatencyRecorder` of all the workers merged.
+        """
+        latency = LatencyRecorder(self.stages)
+        for index in range(self.workers):
+            latency.merge(self.slot(index).latency)
+        return latency
+
+
+class WorkerMetrics:
+    """
+    A single worker's view of its slot of `SharedMetrics`.
+    """
+    def __init__(self, buffer, counter_bytes, stages=STAGES):
+        self.values = np.frombuffer(buffer[:counter_bytes], dtype=np.int64)
+        self._view = memoryview(self.values)
+        self.latency = LatencyRecorder(stages, buffer=buffer[counter_bytes:])
+
+    def __repr__(self):
+        return "%s" % (self.__class__.__name__)
+
+    def counters(self):
+        return dict(zip(COUNTERS, self.values.tolist()))
+
+    def submitted(self, samples):
+        self._view[0] += 1
+        self._view[2] += samples
+
+    def completed(self, samples, timestamps=None):
+        self._view[1] += 1
+        self._view[3] += samples
+        if timestamps is not None:
+            self.latency.record_read(timestamps)
+
+    def update_rss(self):
+        self._view[4] = rss()
+
+
+def rss():
+    """
+    The resident set size of the calling process in bytes.
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        # peak rather than current on platforms without procfs
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
@@ -0,0 +1,132 @@
+"""
+pyguppyclient sparse modified base calls
+"""
+
+import numpy as np
+
+
+CANONICAL = 'ACGT'
+
+# SAM MM tag codes of the modified base long names reported by the server
+MM_CODES = {
+    '5mC': 'm',
+    '5hmC': 'h',
+    '5fC': 'f',
+    '5caC': 'c',
+    '5hmU': 'g',
+    '5fU': 'e',
+    '5caU': 'b',
+    '6mA': 'a',
+    '8oxoG': 'o',
+    'Xao': 'n',
+}
+
+
+def mod_columns(mod_alphabet, long_names=None):
+    """
+    The modifications of a `mod_alphabet` where each canonical base is
+    followed by the labels of its modifications.
+
+    :param mod_alphabet: the labels of the `base_mod_probs` columns.
+    :param long_names: the space separated long names of the modifications, in
+                       alphabet order, used for their MM tag code.
+    :returns: a list of `(canonical, code, column)` tuples, one per modification,
+              the code is the label when the long name has no MM code.
+
+    >>> mod_columns('AXCZGT', '6mA 5mC')
+    [('A', 'a', 1), ('C', 'm', 3)]
+    """
+    names = long_names.split() if long_names else []
+    columns = []
+    canonical = None
+    for column, label in enumerate(mod_alphabet):
+        if label in CANONICAL:
+            canonical = label
+            continue
+        if canonical is None:
+            raise ValueError("modification %r in %r follows no canonical base" % (label, mod_alphabet))
+        name = names[len(columns)] if len(columns) < len(names) else None
+        columns.append((canonical, MM_CODES.get(name, label), column))
+    return columns
+
+
+def sparse_mods(sequence, base_mod_probs, mod_alphabet, long_names=None, threshold=0):
+    """
+    The candidate positions and quantised probability of every modification.
+
+    The uint8 probabilities are kept as sent, no float matrix is made, and
+    only the positions of each modification's canonical base with a
+    probability of at least `threshold` are returned.
+
+    :param sequence: the called sequence.
+    :param base_mod_probs: the uint8 `(len(sequence), len(mod_alphabet))` probabilities.
+    :param mod_alphabet: the labels of the `base_mod_probs` columns.
+    :param long_names: the space separated long names of the modifications.
+    :param threshold: the smallest uint8 probability, in 1/255ths, to keep.
+    :returns: a list of dicts of the `canonical` base, MM `code`, whether every
+              candidate was kept as `complete`, and the `positions` in the
+              sequence and their uint8 `probs`.
+
+    >>> probs = np.zeros((6, 5), dtype=np.uint8)
+    >>> probs[[1, 3, 4], 2] = [250, 10, 200]
+    >>> [(m['code'], m['positions'].tolist(), m['probs'].tolist()) for m in sparse_mods('ACGCCT', probs, 'ACZGT', '5mC', 128)]
+    [('m', [1, 4], [250, 200])]
+    """
+    bases = np.frombuffer(sequence.encode(), dtype=np.uint8)
+    probs = np.asarray(base_mod_probs)
+    candidates = {base: np.flatnonzero(bases == ord(base)) for base in CANONICAL}
+    mods = []
+    for canonical, code, column in mod_columns(mod_alphabet, long_names):
+        positions = candidates[canonical]
+        values = probs[positions, column]
+        if threshold:
+            keep = values >= threshold
+            positions, values = positions[keep], values[keep]
+        mods.append({
+            'canonical': canonical,
+            'code': code,
+            'complete': not threshold,
+            'positions': positions,
+            'probs': values,
+        })
+    return mods
+
+
+def mm_ml_tags(sequence, mods):
+    """
+    The SAM `MM` and `ML` tag values of `sparse_mods` of a read.
+
+    Each MM entry lists the number of its canonical base skipped before
+    each call, so the skips come from the rank of each position among the
+    canonical bases of the read. Thresholded calls are marked `.` as the
+    skipped bases are below the threshold. The ML values are the uint8
+    probabilities as sent by the server, in 1/255ths.
+
+    :returns: the `MM` string and the `ML` uint8 array.
+
+    >>> probs = np.zeros((6, 5), dtype=np.uint8)
+    >>> probs[[1, 3, 4], 2] = [250, 10, 200]
+    >>> mm, ml = mm_ml_tags('ACGCCT', sparse_mods('ACGCCT', probs, 'ACZGT', '5mC', 128))
+    >>> mm, ml.tolist()
+    ('C+m.,0,1;', [250, 200])
+    """
+    bases = np.frombuffer(sequence.encode(), dtype=np.uint8)
+    entries = []
+    for mod in mods:
+        # the rank of each position among the canonical bases
+        rank = np.cumsum(bases == ord(mod['canonical'])) - 1
+        ranks = rank[mod['positions']]
+        skips = np.diff(ranks, prepend=-1) - 1
+        entry = "%s+%s%s" % (mod['canonical'], mod['code'], '' if mod['complete'] else '.')
+        entries.append(",".join([entry] + skips.astype(str).tolist()) + ";")
+    ml = np.concatenate([mod['probs'] for mod in mods]) if mods else np.zeros(0, dtype=np.uint8)
+    return "".join(entries), ml.astype(np.uint8)
+
+
+def called_mods(called, threshold=0):
+    """
+    The `sparse_mods` of a `CalledReadData`, `None` without modified base probabilities.
+    """
+    if called.base_mod_probs is None or not called.mod_alphabet:
+        return
+    return sparse_mods(called.seq, called.base_mod_probs, called.mod_alphabet, called.mod_long_names, threshold)
@@ -0,0 +1,79 @@
+"""
+pyguppyclient move table to signal mapping
+"""
+
+import numpy as np
+
+
+def signal_start(read, called):
+    """
+    The sample of the signal of `read` where the move table of `called` starts,
+    the samples trimmed from the start of the read before basecalling.
+    """
+    return read.total_samples - called.trimmed_samples
+
+
+def base_boundaries(move, stride, start=0, end=None):
+    """
+    The signal sample start and exclusive end of each base of a move table.
+
+    Each base starts at the move it was emitted on and runs to the start of
+    the next base, the last base to the end of the move table or `end`.
+
+    :param move: the move table, non zero where a base was emitted.
+    :param stride: the model stride, samples per move.
+    :param start: the sample the move table starts at.
+    :param end: the end of the signal, defaults to the end of the move table.
+
+    >>> base_boundaries(np.array([1, 0, 1, 1, 0, 0], dtype=np.uint8), 5, start=10)
+    (array([10, 20, 25]), array([20, 25, 40]))
+    """
+    starts = start + np.flatnonzero(move) * stride
+    ends = np.empty_like(starts)
+    ends[:-1] = starts[1:]
+    ends[-1:] = start + len(move) * stride if end is None else end
+    return starts, ends
+
+
+def base_means(signal, starts, ends):
+    """
+    The mean of `signal` over each base.
+
+    The sums come from one `np.add.reduceat` over the interleaved base
+    boundaries, the sums between an end and the next start are dropped.
+
+    >>> base_means(np.arange(10, dtype=np.int16), np.array([0, 4]), np.array([3, 10]))
+    array([1. , 6.5])
+    """
+    if not len(starts):
+        return np.zeros(0)
+    ends = np.minimum(ends, len(signal))
+    bounds = np.empty(2 * len(starts), dtype=np.int64)
+    bounds[0::2] = starts
+    bounds[1::2] = ends
+    # the last base may run to the end of the signal which reduceat takes as implied
+    if bounds[-1] == len(signal):
+        bounds = bounds[:-1]
+    dtype = np.int64 if np.issubdtype(signal.dtype, np.integer) else np.float64
+    sums = np.add.reduceat(signal, bounds, dtype=dtype)[0::2]
+    return sums / (ends - starts)
+
+
+def map_read(read, called, pA=True):
+    """
+    Map the bases of a called read back to its signal.
+
+    :param read: the `ReadData` that was basecalled.
+    :param called: the `CalledReadData` of the read.
+    :param pA: report the mean current in pA rather than raw daq units.
+    :returns: a dict of per base `start` and `end` samples, `dwell` in samples
+              and `mean` current.
+    """
+    starts, ends = base_boundaries(
+        called.move, called.model_stride, signal_start(read, called), read.total_samples
+    )
+    means = base_means(read.signal, starts, ends)
+    if pA:
+        means = (means + read.daq_offset) * read.daq_scaling
+    return {'start': starts, 'end': ends, 'dwell': ends - starts, 'mean': means}
+
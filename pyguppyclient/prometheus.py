@@ -0,0 +1,168 @@
+"""
+pyguppyclient Prometheus metrics endpoint
+"""
+
+import logging
+from threading import Thread, Lock
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from pyguppyclient.stats import StatsCollector
+
+
+logger = logging.getLogger("pyguppyclient")
+
+# latency histogram bucket bounds in seconds
+BOUNDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class MetricsServer:
+    """
+    A local HTTP endpoint serving the metrics of a `Caller` run in the
+    Prometheus text exposition format.
+
+    The worker counters and latency histograms are read straight from the
+    shared memory the workers update, the statistics of every server are
+    polled concurrently on each scrape so a scrape waits at most `timeout`.
+
+    :param metrics: the `SharedMetrics` of the workers.
+    :param servers: a list of `(host, port)` tuples of the basecall servers.
+    :param host: the address to serve on.
+    :param port: the port to serve on.
+    :param timeout: the time in seconds to wait for the server statistics replies.
+    """
+    def __init__(self, metrics, servers=(), host='127.0.0.1', port=9090, timeout=0.5):
+        self.metrics = metrics
+        self.servers = list(servers)
+        self.address = (host, port)
+        self.timeout = timeout
+        self.httpd = None
+        self.thread = None
+        self.collector = None
+        # the collector's sockets are shared by the scrape threads
+        self.lock = Lock()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.stop()
+
+    def start(self):
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = exporter.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format, *args)
+
+        self.collector = StatsCollector(["%s:%s" % server for server in self.servers], timeout=self.timeout, history=1)
+        self.httpd = ThreadingHTTPServer(self.address, Handler)
+        self.thread = Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        logger.debug("serving metrics on http://%s:%s/metrics", *self.httpd.server_address)
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.thread.join()
+            self.httpd = None
+        if self.collector is not None:
+            self.collector.close()
+            self.collector = None
+
+    def render(self):
+        """
+        The current metrics in the Prometheus text exposition format.
+        """
+        lines = []
+
+        def metric(name, kind, help, samples):
+            lines.append("# HELP %s %s" % (name, help))
+            lines.append("# TYPE %s %s" % (name, kind))
+            for labels, value in samples:
+                lines.append("%s%s %s" % (name, _labels(labels), value))
+
+        workers = self.metrics.counters()
+
+        for counter, help in (
+                ('reads_submitted', 'Reads passed to the server.'),
+                ('reads_completed', 'Reads returned by the server.'),
+                ('samples_submitted', 'Raw samples passed to the server.'),
+                ('samples_completed', 'Raw samples returned by the server.'),
+        ):
+            metric("pyguppyclient_%s_total" % counter, "counter", help, [
+                ({'worker': worker}, counters[counter]) for worker, counters in enumerate(workers)
+            ])
+
+        metric("pyguppyclient_reads_inflight", "gauge", "Reads passed to the server and not yet returned.", [
+            ({'worker': worker}, counters['reads_submitted'] - counters['reads_completed'])
+            for worker, counters in enumerate(workers)
+        ])
+
+        metric("pyguppyclient_worker_rss_bytes", "gauge", "Resident set size of the worker process.", [
+            ({'worker': worker}, counters['rss_bytes']) for worker, counters in enumerate(workers)
+        ])
+
+        name = "pyguppyclient_read_stage_seconds"
+        lines.append("# HELP %s Read lifecycle latency by stage." % name)
+        lines.append("# TYPE %s histogram" % name)
+        for stage, histogram in self.metrics.latency().histograms.items():
+            cumulative = histogram.cumulative([bound * 1e9 for bound in BOUNDS])
+            for bound, count in zip(BOUNDS, cumulative):
+                lines.append('%s_bucket%s %s' % (name, _labels({'stage': stage, 'le': bound}), count))
+            count = histogram.count
+            lines.append('%s_bucket%s %s' % (name, _labels({'stage': stage, 'le': '+Inf'}), count))
+            lines.append('%s_sum%s %s' % (name, _labels({'stage': stage}), histogram.total / 1e9))
+            lines.append('%s_count%s %s' % (name, _labels({'stage': stage}), count))
+
+        stats = self.server_statistics()
+        metric("guppy_server_up", "gauge", "Whether the server answered the statistics request.", [
+            ({'server': server}, int(res is not None)) for server, res in stats
+        ])
+        for name, kind, help, field in (
+                ('lifetime_reads_in_total', 'counter', 'Reads received by the server.', 'reads_in'),
+                ('lifetime_reads_out_total', 'counter', 'Reads returned by the server.', 'reads_out'),
+                ('period_reads_in', 'gauge', 'Reads received by the server in the last period.', 'period_reads_in'),
+                ('period_reads_out', 'gauge', 'Reads returned by the server in the last period.', 'period_reads_out'),
+        ):
+            metric("guppy_server_%s" % name, kind, help, [
+                ({'server': server}, res[field]) for server, res in stats if res is not None
+            ])
+
+        return "\n".join(lines) + "\n"
+
+    def server_statistics(self):
+        """
+        The `StatsCollector.poll` result of every server, `None` for those that didn't reply.
+        """
+        if self.collector is None:
+            return [("%s:%s" % server, None) for server in self.servers]
+        with self.lock:
+            return list(self.collector.poll().items())
+
+
+def _labels(labels):
+    """
+    Format a dict of labels.
+
+    >>> _labels({'stage': 'load', 'le': 0.5})
+    '{stage="load",le="0.5"}'
+    >>> _labels({})
+    ''
+    """
+    if not labels:
+        return ''
+    return "{%s}" % ",".join('%s="%s"' % (key, value) for key, value in labels.items())
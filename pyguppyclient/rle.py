@@ -0,0 +1,124 @@
+"""
+pyguppyclient runlength trace decoding
+"""
+
+import numpy as np
+
+
+ALPHABET = 'ACGT'
+
+
+def _bases(base):
+    """
+    The base labels of a runlength trace as indexes into `ALPHABET`, the
+    server may send either the indexes or ASCII codes.
+    """
+    base = np.asarray(base)
+    if len(base) and base.max() >= len(ALPHABET):
+        lookup = np.full(256, len(ALPHABET), dtype=np.uint8)
+        lookup[np.frombuffer(ALPHABET.encode(), dtype=np.uint8)] = np.arange(len(ALPHABET))
+        return lookup[base.astype(np.uint8)]
+    return base.astype(np.uint8)
+
+
+def runlength_probability(runlength, shape, scale):
+    """
+    The probability of each `runlength` under the discrete Weibull distribution
+    with `shape` and `scale` the model predicts for its run.
+
+    >>> runlength_probability(np.array([1, 2]), np.array([1.0, 1.0]), np.array([1.0, 1.0])).round(3)
+    array([0.632, 0.233])
+    """
+    runlength = np.asarray(runlength, dtype=np.float64)
+    shape = np.asarray(shape, dtype=np.float64)
+    scale = np.asarray(scale, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        below = np.exp(-np.power((runlength - 1) / scale, shape))
+        upto = np.exp(-np.power(runlength / scale, shape))
+    return below - upto
+
+
+def expand(trace):
+    """
+    Expand a runlength trace into its base sequence and per position arrays.
+
+    :param trace: the runlength `trace` dict of a `CalledReadData`.
+    :returns: a dict of the expanded `sequence`, the `run` each position
+              belongs to, the `offset` of the position within its run and the
+              `weight` and runlength `probability` of its run, both repeated
+              for every position.
+
+    >>> trace = {'base': np.array([0, 2, 3]), 'runlength': np.array([2, 1, 3]), 'weight': np.array([0.9, 0.8, 0.7]),
+    ...          'shape': np.ones(3), 'scale': np.full(3, 2.0)}
+    >>> expanded = expand(trace)
+    >>> expanded['sequence'], expanded['run'].tolist(), expanded['offset'].tolist()
+    ('AAGTTT', [0, 0, 1, 2, 2, 2], [0, 1, 0, 0, 1, 2])
+    """
+    runlength = np.asarray(trace['runlength'], dtype=np.int64)
+    runs = len(runlength)
+    run = np.repeat(np.arange(runs), runlength)
+    starts = np.cumsum(runlength) - runlength
+    offset = np.arange(len(run)) - starts[run]
+
+    labels = np.frombuffer((ALPHABET + 'N').encode(), dtype=np.uint8)
+    sequence = labels[_bases(trace['base'])][run].tobytes().decode()
+
+    expanded = {'sequence': sequence, 'run': run, 'offset': offset}
+    if trace.get('weight') is not None:
+        expanded['weight'] = np.asarray(trace['weight'])[run]
+    if trace.get('shape') is not None and trace.get('scale') is not None:
+        expanded['probability'] = runlength_probability(runlength, trace['shape'], trace['scale'])[run]
+    return expanded
+
+
+def runlength_histogram(traces, max_runlength=16):
+    """
+    The counts of each called runlength by base across many reads.
+
+    :param traces: the runlength `trace` dicts of the reads.
+    :param max_runlength: the longest runlength counted separately, longer runs are
+                          counted as `max_runlength`.
+    :returns: an array of shape `(len(ALPHABET), max_runlength + 1)` where the
+              element `[base, length]` is the number of runs of `length`.
+
+    >>> traces = [{'base': np.array([0, 2, 0]), 'runlength': np.array([2, 1, 20])},
+    ...           {'base': np.array([3]), 'runlength': np.array([1])}]
+    >>> histogram = runlength_histogram(traces, max_runlength=4)
+    >>> histogram[0].tolist(), histogram[:, 1].tolist()
+    ([0, 0, 1, 0, 1], [0, 0, 1, 1])
+    """
+    traces = [trace for trace in traces if trace is not None and len(trace['runlength'])]
+    width = max_runlength + 1
+    histogram = np.zeros((len(ALPHABET), width), dtype=np.int64)
+    if not traces:
+        return histogram
+    base = np.concatenate([_bases(trace['base']) for trace in traces]).astype(np.int64)
+    runlength = np.concatenate([trace['runlength'] for trace in traces]).astype(np.int64)
+    known = base < len(ALPHABET)
+    flat = base[known] * width + np.clip(runlength[known], 0, max_runlength)
+    histogram += np.bincount(flat, minlength=histogram.size).reshape(histogram.shape)
+    return histogram
+
+
+def runlength_summary(histogram):
+    """
+    The runs, mean runlength and fraction of homopolymer runs, longer than
+    one, of each base of a `runlength_histogram`.
+
+    >>> summary = runlength_summary(np.array([[0, 3, 1], [0, 0, 0], [0, 2, 0], [0, 0, 2]]))
+    >>> summary['A']['runs'], summary['A']['mean'], summary['A']['homopolymer']
+    (4, 1.25, 0.25)
+    """
+    lengths = np.arange(histogram.shape[1])
+    runs = histogram.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = (histogram * lengths).sum(axis=1) / runs
+        homopolymer = histogram[:, 2:].sum(axis=1) / runs
+    return {
+        base: {
+            'runs': int(runs[i]),
+            'mean': float(means[i]) if runs[i] else 0.0,
+            'homopolymer': float(homopolymer[i]) if runs[i] else 0.0,
+        }
+        for i, base in enumerate(ALPHABET)
+    }
@@ -0,0 +1,87 @@
+"""
+pyguppyclient client side signal scaling
+"""
+
+import numpy as np
+
+
+def _histogram_median(counts, total):
+    """
+    The median index of a histogram of `total` values, half way between the
+    two middle values for an even `total` as with `np.median`.
+    """
+    cumulative = np.cumsum(counts)
+    lower = np.searchsorted(cumulative, (total - 1) // 2 + 1)
+    upper = np.searchsorted(cumulative, total // 2 + 1)
+    return (lower + upper) / 2
+
+
+def median_mad(signal, chunk=2**20):
+    """
+    The median and median absolute deviation of an integer raw `signal`.
+
+    Both come from a histogram of the signal, so the cost is linear in the
+    length of the read and the signal is only visited `chunk` samples at a
+    time, giving the exact result for reads of any length in bounded memory.
+
+    >>> signal = np.array([3, 9, 1, 7, 5, 2], dtype=np.int16)
+    >>> median_mad(signal) == (np.median(signal), np.median(np.abs(signal - np.median(signal))))
+    True
+    >>> signal = np.random.RandomState(1).randint(-500, 1500, 100001).astype(np.int16)
+    >>> median, mad = median_mad(signal, chunk=1000)
+    >>> bool(median == np.median(signal) and mad == np.median(np.abs(signal - median)))
+    True
+    """
+    total = len(signal)
+    if total == 0:
+        return 0.0, 0.0
+
+    low = int(signal.min())
+    high = int(signal.max())
+    counts = np.zeros(high - low + 1, dtype=np.int64)
+    for start in range(0, total, chunk):
+        counts += np.bincount(signal[start:start + chunk].astype(np.int32) - low, minlength=len(counts))
+
+    median = low + _histogram_median(counts, total)
+
+    # deviations are doubled to stay integers when the median falls between two values
+    deviations = np.abs(2 * (np.arange(low, high + 1) - median)).astype(np.int64)
+    counts = np.bincount(deviations, weights=counts)
+    mad = _histogram_median(counts, total) / 2
+
+    return float(median), float(mad)
+
+
+def read_scaling(read, trim=0, chunk=2**20):
+    """
+    The median and median absolute deviation in pA of the signal of the
+    `ReadData` `read` after the first `trim` samples, those the server
+    trims before scaling.
+    """
+    median, mad = median_mad(read.signal[trim:], chunk)
+    scaling = float(read.daq_scaling)
+    return (median + read.daq_offset) * scaling, mad * scaling
+
+
+def scale_reads(reads, trim=0, chunk=2**20):
+    """
+    Set the `scaling_override` of each `ReadData` in `reads` to its `read_scaling`.
+    """
+    for read in reads:
+        read.scaling_override = read_scaling(read, trim, chunk)
+    return reads
+
+
+def check_scaling(override, scaling, rtol=1e-3):
+    """
+    Check a `(median, med_abs_dev)` scaling in pA against the `scaling` a
+    called read reports, returning `None` when the server gave no scaling.
+
+    >>> check_scaling((80.0, 10.0), {'median': 80.0, 'med_abs_dev': 10.001})
+    True
+    >>> check_scaling((80.0, 10.0), {'median': 95.0, 'med_abs_dev': 10.0})
+    False
+    """
+    if not scaling or scaling.get('median') is None or scaling.get('med_abs_dev') is None:
+        return
+    return bool(np.allclose(override, (scaling['median'], scaling['med_abs_dev']), rtol=rtol))
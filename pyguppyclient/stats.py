@@ -0,0 +1,202 @@
+"""
+pyguppyclient server statistics
+"""
+
+import json
+import logging
+from time import time, perf_counter
+
+import zmq
+import numpy as np
+
+from pyguppyclient.ipc import simple_request, simple_response, SimpleRequestType
+
+
+logger = logging.getLogger("pyguppyclient")
+
+FIELDS = ('time', 'reads_in', 'reads_out', 'period_reads_in', 'period_reads_out', 'rate_in', 'rate_out', 'backlog')
+
+
+def server_stats(res):
+    """
+    Convert a `ServerStats` reply into a dict including the per client counts.
+    """
+    return {
+        'reads_in': res.LifetimeReadsIn(),
+        'reads_out': res.LifetimeReadsOut(),
+        'period_reads_in': res.PeriodReadsIn(),
+        'period_reads_out': res.PeriodReadsOut(),
+        'clients': [
+            (client.InputReadCount(), client.OutputReadCount())
+            for client in (res.ClientStatistics(i) for i in range(res.ClientStatisticsLength()))
+        ],
+    }
+
+
+class RingBuffer:
+    """
+    Fixed size in memory time series of float64 rows.
+
+    >>> ring = RingBuffer(3, ('a', 'b'))
+    >>> for i in range(5): ring.append((i, i * 10))
+    >>> len(ring)
+    3
+    >>> ring.array()['a'].tolist()
+    [2.0, 3.0, 4.0]
+    >>> float(ring.last()['b'])
+    40.0
+    """
+    def __init__(self, size, fields=FIELDS):
+        self.size = size
+        self.fields = fields
+        self.data = np.zeros(size, dtype=[(field, np.float64) for field in fields])
+        self.count = 0
+
+    def __repr__(self):
+        return "%s(%s/%s)" % (self.__class__.__name__, len(self), self.size)
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+    def append(self, row):
+        self.data[self.count % self.size] = tuple(row)
+        self.count += 1
+
+    def last(self):
+        if self.count:
+            return self.data[(self.count - 1) % self.size]
+
+    def array(self):
+        """
+        The rows in the order they were appended.
+        """
+        if self.count <= self.size:
+            return self.data[:self.count].copy()
+        start = self.count % self.size
+        return np.concatenate([self.data[start:], self.data[:start]])
+
+
+class StatsCollector:
+    """
+    Polls the statistics of many guppy_basecall_servers concurrently.
+
+    A request is sent to every server at once and the replies gathered with
+    a single poller, so one round costs a single network round trip however
+    many servers are watched. The reads in/out rates are computed from the
+    lifetime counters of consecutive rounds and every round is kept in a
+    per server ring buffer.
+
+    :param servers: a list of `host:port` addresses.
+    :param timeout: the time in seconds to wait for the replies.
+    :param history: the number of rounds to keep for each server.
+    """
+    def __init__(self, servers, timeout=1.0, history=3600):
+        self.servers = list(servers)
+        self.timeout = timeout
+        self.context = zmq.Context.instance()
+        self.sockets = {server: self._socket(server) for server in self.servers}
+        self.series = {server: RingBuffer(history) for server in self.servers}
+        self.clients = {server: [] for server in self.servers}
+        self.previous = dict()
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, len(self.servers))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+    def _socket(self, server):
+        socket = self.context.socket(zmq.REQ)
+        socket.set(zmq.LINGER, 0)
+        socket.connect("tcp://%s" % server)
+        return socket
+
+    def close(self):
+        for socket in self.sockets.values():
+            socket.close()
+
+    def poll(self):
+        """
+        Poll every server once.
+
+        :returns: a dict of server address to a dict of the latest `FIELDS`
+                  and per client counts, or `None` for servers that timed out.
+        """
+        request = simple_request(SimpleRequestType.GET_STATISTICS)
+        poller = zmq.Poller()
+        waiting = dict()
+
+        for server, socket in self.sockets.items():
+            socket.send(request)
+            poller.register(socket, zmq.POLLIN)
+            waiting[socket] = server
+
+        results = {server: None for server in self.servers}
+        deadline = perf_counter() + self.timeout
+
+        try:
+            while waiting:
+                remaining = deadline - perf_counter()
+                if remaining <= 0:
+                    break
+                for socket, _ in poller.poll(remaining * 1000):
+                    server = waiting.pop(socket)
+                    poller.unregister(socket)
+                    try:
+                        stats = server_stats(simple_response(socket.recv()))
+                    except Exception as e:
+                        logger.debug("bad statistics reply from %s: %s", server, e)
+                        continue
+                    results[server] = self._update(server, stats)
+        finally:
+            # a REQ socket without its reply can't send again so replace it
+            for socket, server in waiting.items():
+                socket.close()
+                self.sockets[server] = self._socket(server)
+                self.previous.pop(server, None)
+
+        return results
+
+    def _update(self, server, stats):
+        now = time()
+        rate_in = rate_out = 0.0
+        if server in self.previous:
+            then, reads_in, reads_out = self.previous[server]
+            elapsed = max(now - then, 1e-9)
+            rate_in = (stats['reads_in'] - reads_in) / elapsed
+            rate_out = (stats['reads_out'] - reads_out) / elapsed
+        self.previous[server] = now, stats['reads_in'], stats['reads_out']
+
+        stats.update(
+            time=now, rate_in=rate_in, rate_out=rate_out,
+            backlog=max(stats['reads_in'] - stats['reads_out'], 0),
+        )
+        self.series[server].append([stats[field] for field in FIELDS])
+        self.clients[server] = stats['clients']
+        return stats
+
+
+def write_csv(results, fd, header=False):
+    """
+    Write a round of `StatsCollector.poll` results as CSV rows.
+    """
+    if header:
+        fd.write(",".join(('server',) + FIELDS + ('clients',)) + "\n")
+    for server, stats in results.items():
+        if stats is None:
+            continue
+        clients = " ".join("%s/%s" % client for client in stats['clients'])
+        fd.write(",".join([server] + ["%s" % stats[field] for field in FIELDS] + [clients]) + "\n")
+
+
+def write_jsonl(results, fd):
+    """
+    Write a round of `StatsCollector.poll` results as JSON lines.
+    """
+    for server, stats in results.items():
+        if stats is None:
+            continue
+        fd.write(json.dumps(dict(server=server, **stats)) + "\n")
@@ -4,6 +4,8 @@ pyguppyclient utils
 
 import os
 
+POLICIES = ('fifo', 'longest', 'binned')
+
 
 def distribute(files, num_procs):
     """
@@ -78,6 +80,57 @@ def parse_config(filename):
         return os.path.basename(filename)
 
 
+def parse_server(server, host='127.0.0.1'):
+    """
+    Parse a server endpoint given as a port, a `host:port` string or
+    a `(host, port)` tuple into a `(host, port)` tuple.
+
+    >>> parse_server(5555)
+    ('127.0.0.1', 5555)
+    >>> parse_server('5556')
+    ('127.0.0.1', 5556)
+    >>> parse_server('gpu1:5557')
+    ('gpu1', 5557)
+    >>> parse_server(('gpu2', '5558'))
+    ('gpu2', 5558)
+    """
+    if isinstance(server, (tuple, list)):
+        host, port = server
+    elif isinstance(server, str) and ':' in server:
+        host, port = server.rsplit(':', 1)
+    else:
+        port = server
+    return host, int(port)
+
+
+def schedule(items, policy='fifo', key=len, bins=4):
+    """
+    Order `items` for submission by the length given by `key`.
+
+    `fifo` keeps the order, `longest` submits the longest first so no long
+    item is left running alone at the end, `binned` splits the items into
+    `bins` length bins and interleaves them longest bin first so long and
+    short items stay mixed while the tail is made of short ones.
+
+    >>> schedule([3, 9, 1, 7, 5], 'longest', key=abs)
+    [9, 7, 5, 3, 1]
+    >>> schedule([3, 9, 1, 7, 5, 2], 'binned', key=abs, bins=2)
+    [9, 3, 7, 2, 5, 1]
+    >>> schedule([3, 9, 1], key=abs)
+    [3, 9, 1]
+    """
+    if policy == 'fifo':
+        return list(items)
+    ordered = sorted(items, key=key, reverse=True)
+    if policy == 'longest':
+        return ordered
+    if policy == 'binned':
+        size = -(-len(ordered) // bins) or 1
+        groups = [ordered[i:i + size] for i in range(0, len(ordered), size)]
+        return [group[rank] for rank in range(size) for group in groups if rank < len(group)]
+    raise ValueError("Unknown policy '{}', expected one of {}".format(policy, POLICIES))
+
+
 if __name__ == "__main__":
     import doctest
     doctest.testmod()
@@ -4,6 +4,7 @@ from unittest import TestCase, main, skip
 
 from pyguppyclient.decode import Config
 from pyguppyclient.io import yield_reads
+import pyguppyclient.ipc
 from pyguppyclient import GuppyBasecallerClient
 
 
@@ -55,5 +56,5 @@ class ClientTest(TestCase):
 
 
 if __name__ == "__main__":
-    os.environ["DEBUG_TRANSPORT"] = "1"
+    pyguppyclient.ipc.DEBUG_TRANSPORT = True
     main(verbosity=0)
@@ -0,0 +1,183 @@
+from unittest import TestCase, main, mock
+
+import numpy as np
+
+from pyguppyclient import caller
+from pyguppyclient.caller import Caller
+from pyguppyclient.flow import MemoryBudget
+from pyguppyclient.decode import ReadData, CalledReadData
+
+
+def bulk(read):
+    return 0, None
+
+
+def urgent_first(read):
+    return (1 if read.read_id.startswith('urgent') else 0), None
+
+
+def failing_callback(read, called, lock):
+    raise RuntimeError("callback failed")
+
+
+class StubClient:
+    """
+    A connected client that calls the reads it accepts in order.
+    """
+    def __init__(self, capacity=10000, fail_after=None, patience=1000, scaling=None):
+        self.capacity = capacity
+        self.scaling = scaling
+        self.fail_after = fail_after
+        self.patience = patience
+        self.idle = 0
+        self.queued = []
+        self.passed = []
+        self.overrides = []
+        self.returned = 0
+        self.most_inflight = 0
+        self.disconnected = False
+        self.completed_ns = self.decoded_ns = 0
+
+    def pass_read(self, read):
+        if len(self.queued) >= self.capacity:
+            return False
+        self.queued.append(read)
+        self.passed.append(read.read_id)
+        self.overrides.append(read.scaling_override)
+        self.most_inflight = max(self.most_inflight, len(self.queued))
+        return True
+
+    def _get_called_read(self):
+        if self.fail_after is not None and self.returned >= self.fail_after:
+            raise ConnectionError("server went away")
+        if not self.queued:
+            # nothing in flight and nothing submitted, the caller is starving
+            self.idle += 1
+            if self.idle > self.patience:
+                raise AssertionError("no reads submitted with none in flight")
+            return
+        self.idle = 0
+        read = self.queued.pop(0)
+        self.returned += 1
+        called = CalledReadData('ACGT', '5555', 8, 4, 40, 'crf', read.total_samples, 5, 10.0, scaling=self.scaling)
+        return {'metadata': {'read_id': read.read_id}}, called
+
+    def disconnect(self):
+        self.disconnected = True
+
+
+class CallerFlowTest(TestCase):
+
+    host, port = '127.0.0.1', 5555
+
+    def setUp(self):
+        caller._windows.clear()
+        caller._clients.clear()
+        caller._budget = None
+        self.reads = {
+            'bulk.fast5': [ReadData(np.zeros(1000, dtype=np.int16), 'bulk-%s' % i) for i in range(20)],
+            'urgent.fast5': [ReadData(np.zeros(1000, dtype=np.int16), 'urgent-%s' % i) for i in range(5)],
+        }
+
+    def tearDown(self):
+        caller._windows.clear()
+        caller._clients.clear()
+        caller._budget = None
+
+    def basecall_batch(self, files, client, port=None, **kwargs):
+        port = port or self.port
+        worker = Caller('dna_r9.4.1_450bps_fast', host=self.host, port=port, **kwargs)
+        worker.snooze = 0
+        worker.lock = None
+        caller._clients[worker._client_key(self.host, port)] = client
+        with mock.patch.object(caller, 'yield_reads', lambda fn, read_filter=None: iter(self.reads[fn])):
+            return worker.basecall_batch(files, self.host, port)
+
+    def test_window_admission(self):
+        """ no more reads are in flight than the window allows """
+        client = StubClient()
+        samples = self.basecall_batch(['bulk.fast5'], client, adaptive=True, inflight=3, max_inflight=3)[0]
+        self.assertEqual(client.returned, 20)
+        self.assertEqual(samples, 20 * 1000)
+        self.assertEqual(client.most_inflight, 3)
+
+    def test_reserve_admits_urgent_first(self):
+        """ reads with a priority are admitted ahead of the bulk reads """
+        client = StubClient()
+        self.basecall_batch(
+            ['bulk.fast5', 'urgent.fast5'], client, adaptive=True, inflight=4, max_inflight=4,
+            reserve=2, priority=urgent_first,
+        )
+        self.assertEqual(client.returned, 25)
+        self.assertTrue(all(read_id.startswith('urgent') for read_id in client.passed[:5]))
+
+    def test_reserve_starvation(self):
+        """ bulk reads are still admitted with a window no larger than the reserve """
+        client = StubClient()
+        self.basecall_batch(
+            ['bulk.fast5'], client, adaptive=True, inflight=2, max_inflight=2, reserve=2, priority=bulk,
+        )
+        self.assertEqual(client.returned, 20)
+        self.assertEqual(client.most_inflight, 1)
+
+    def test_shards(self):
+        """ each server's batches go to its own client and in-flight window """
+        first, second = StubClient(), StubClient()
+        self.basecall_batch(['bulk.fast5'], first, adaptive=True, inflight=3, max_inflight=3)
+        self.basecall_batch(['urgent.fast5'], second, port=5556, adaptive=True, inflight=3, max_inflight=3)
+        self.assertEqual((first.returned, second.returned), (20, 5))
+        self.assertEqual(set(caller._windows), {(self.host, 5555), (self.host, 5556)})
+        self.assertTrue(all(len(window) == 0 for window in caller._windows.values()))
+
+    def test_budget_limits_loading(self):
+        """ reads are only loaded and submitted while the budget has room for them """
+        client = StubClient()
+        caller._budget = budget = MemoryBudget(3 * 2000)
+        self.basecall_batch(['bulk.fast5'], client)
+        self.assertEqual(client.returned, 20)
+        self.assertLessEqual(budget.peaks()['inflight'], 3 * 2000)
+        self.assertLessEqual(client.most_inflight, 3)
+        self.assertEqual(budget.usage()['total'], 0)
+
+    def test_budget_released_on_failure(self):
+        """ a failed batch returns its loaded and in-flight bytes and window slots """
+        client = StubClient(fail_after=5)
+        caller._budget = budget = MemoryBudget(10 * 2000)
+        with self.assertRaises(ConnectionError):
+            self.basecall_batch(['bulk.fast5'], client, adaptive=True, inflight=4, max_inflight=4)
+        self.assertTrue(client.disconnected)
+        self.assertEqual(caller._clients, {})
+        self.assertEqual(budget.usage(), {'loaded': 0, 'inflight': 0, 'pending': 0, 'total': 0})
+        self.assertEqual(len(caller._windows[(self.host, self.port)]), 0)
+
+    def test_budget_released_on_callback_failure(self):
+        """ a called read held by a failing callback is returned to the budget """
+        client = StubClient()
+        caller._budget = budget = MemoryBudget(10 * 2000)
+        with self.assertRaises(RuntimeError):
+            self.basecall_batch(['bulk.fast5'], client, callback=failing_callback)
+        self.assertGreater(budget.peaks()['pending'], 0)
+        self.assertEqual(budget.usage()['total'], 0)
+
+    def test_client_scaling_checked(self):
+        """ a sample of reads is left to the server's scaling and checked against the client's """
+        client = StubClient(scaling={'median': 95.0, 'med_abs_dev': 10.0})
+        with self.assertLogs('pyguppyclient', level='WARNING') as logs:
+            self.basecall_batch(['bulk.fast5'], client, transport='zmq', client_scaling=True, scaling_check=5)
+        self.assertEqual(client.returned, 20)
+        self.assertEqual([override is None for override in client.overrides], [i % 5 == 0 for i in range(20)])
+        self.assertEqual(len(logs.output), 4)
+
+    def test_reserve_needs_adaptive(self):
+        """ a reserve without an in-flight window is rejected """
+        with self.assertRaises(ValueError):
+            Caller('dna_r9.4.1_450bps_fast', reserve=2)
+
+    def test_unknown_policy(self):
+        """ an unknown submission policy is rejected before any work starts """
+        with self.assertRaises(ValueError):
+            Caller('dna_r9.4.1_450bps_fast', policy='shortest')
+
+
+if __name__ == "__main__":
+    main()